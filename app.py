@@ -1,27 +1,98 @@
-from flask import Flask, jsonify, render_template, request, session, redirect, url_for, flash
+from flask import Flask, jsonify, render_template, request, session, redirect, url_for, flash, g, stream_with_context, send_from_directory, has_request_context
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from datetime import datetime
-from sqlalchemy import or_, func
+import click
+from datetime import datetime, date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from collections import defaultdict, deque, OrderedDict
+from functools import wraps
+from sqlalchemy import Select, event, tuple_, or_, and_, func, text, case, null, bindparam, insert, update, select, table as sa_table, column as sa_column, inspect as sa_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import joinedload, load_only
 import os
-from werkzeug.utils import secure_filename
+import re
+import json
+import math
+import base64
+import cProfile
+import csv
+import gzip
+import io
+import mimetypes
+import pstats
+import zlib
+import hashlib
+import random
+import secrets
+import signal
+import socket
+import sqlite3
+import threading
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.datastructures import MultiDict
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow اختياري: بدونه تُحفظ الصورة الأصلية فقط دون نسخ مصغرة
+    Image = ImageOps = None
+
+try:
+    import brotli
+except ImportError:  # brotli اختياري: بدونه تُبنى نسخ .gz فقط
+    brotli = None
+
 # ===== إعدادات التطبيق =====
 ADMIN_USERNAME_DEFAULT = 'hossam_admin'
 ADMIN_PASSWORD_DEFAULT = 'strong_password123'
 LOW_STOCK_THRESHOLD = 5
+# حجم صفحات أقسام لوحة الإدارة (تُحمّل عند فتح كل قسم)
+ADMIN_PAGE_SIZE = 25
+ADMIN_MAX_PAGE_SIZE = 100
 
 # إعدادات رفع الملفات
 UPLOAD_FOLDER = 'static/product_images'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# عروض نسخ WebP المصغرة المولدة لكل صورة (تُستخدم في srcset)
+IMAGE_VARIANT_WIDTHS = (1280, 640, 320)
 
 # ===== تكوين Flask و SQLAlchemy =====
 app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your_super_secret_key_12345'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your_super_secret_key_12345')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
+    # بعض المنصات تعطي الصيغة القديمة التي لا يقبلها SQLAlchemy 2
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://' + app.config['SQLALCHEMY_DATABASE_URI'][len('postgres://'):]
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite: انتظار القفل بدل فشل 'database is locked' فوراً، وضبط WAL عبر PRAGMA عند كل اتصال
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'connect_args': {'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    }
+else:
+    # PostgreSQL وغيره: مجمع اتصالات لكل عملية (العمال × DB_POOL_SIZE يجب أن يتسع له الخادم)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True
+    }
+# نسخة قراءة متماثلة اختيارية لمسارات الكتالوج؛ بعد أي كتابة يبقى الزائر على القاعدة الرئيسية لفترة
+if os.environ.get('REPLICA_DATABASE_URL'):
+    app.config['SQLALCHEMY_BINDS'] = {'replica': os.environ['REPLICA_DATABASE_URL']}
+app.config['REPLICA_STICKY_SECONDS'] = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+# روابط static تحمل بصمة المحتوى وتُخزن في المتصفح لمدة سنة دون إعادة تحقق
+app.config['STATIC_FINGERPRINT'] = os.environ.get('STATIC_FINGERPRINT', '1') == '1'
+app.config['STATIC_IMMUTABLE_MAX_AGE'] = 365 * 24 * 3600
 # إعدادات العملات (قاعدة الأسعار مخزنة افتراضياً بوحدة USD)
 app.config['CURRENCY_RATES'] = {
     'USD': 1.0,
@@ -35,10 +106,119 @@ app.config['CURRENCY_POSITION'] = {
     'USD': 'prefix',
     'SAR': 'suffix'
 }
+app.config['CURRENCY_DECIMALS'] = {
+    'USD': 2,
+    'SAR': 2
+}
 app.config['DEFAULT_CURRENCY'] = 'USD'
+# ملف JSON اختياري بجداول الأسعار يُعاد تحميله عند تغيّره دون إعادة تشغيل (يُفحص كل N ثانية)
+app.config['CURRENCY_RATES_FILE'] = os.environ.get('CURRENCY_RATES_FILE')
+app.config['CURRENCY_RATES_CHECK_INTERVAL'] = int(os.environ.get('CURRENCY_RATES_CHECK_INTERVAL', 30))
+# حجم صفحة قائمة المنتجات (قابل للتغيير عبر limit= حتى الحد الأقصى)
+app.config['PRODUCTS_PAGE_SIZE'] = 24
+app.config['PRODUCTS_MAX_PAGE_SIZE'] = 100
+# ذاكرة مؤقتة لاستجابات الكتالوج العامة (لكل عملية؛ TTL يحدّ من التقادم بين العمليات)
+app.config['RESPONSE_CACHE_ENABLED'] = os.environ.get('RESPONSE_CACHE_ENABLED', '1') == '1'
+app.config['RESPONSE_CACHE_SIZE'] = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+app.config['RESPONSE_CACHE_TTL'] = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+# مخزن السلة والمفضلة على الخادم: 'database' (مشترك بين العمليات) أو 'memory' (عملية واحدة)
+app.config['CART_STORE'] = os.environ.get('CART_STORE', 'database')
+# طابور المهام الخلفية (جدول job): المحاولات، والتأخير الأسي بين الإعادات، ومهلة استعادة مهام عامل متوقف
+app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+app.config['JOB_RETRY_BASE_DELAY'] = int(os.environ.get('JOB_RETRY_BASE_DELAY', 10))
+app.config['JOB_RETRY_MAX_DELAY'] = int(os.environ.get('JOB_RETRY_MAX_DELAY', 3600))
+app.config['JOB_LOCK_TIMEOUT'] = int(os.environ.get('JOB_LOCK_TIMEOUT', 300))
+app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+# قياس الطلبات: Server-Timing، وتسجيل الطلبات الأبطأ من SLOW_REQUEST_MS مع تفصيل استعلاماتها
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', '1') == '1'
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+# نافذة الأرقام الحديثة (المئينات وأبطأ الاستعلامات) بالثواني؛ METRICS_TOKEN يسمح لـ Prometheus بالقراءة دون جلسة
+app.config['METRICS_WINDOW_SECONDS'] = int(os.environ.get('METRICS_WINDOW_SECONDS', 600))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# التوصيف عند الطلب (cProfile): ?profile=1 أو X-Profile: 1 لمشرف مسجل، ونسبة من كل الطلبات تُوصَّف عشوائياً (0 = معطّل)
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '1') == '1'
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 100))
+# مدة صلاحية مفاتيح منع التكرار (Idempotency-Key) لـ checkout والدفع
+app.config['IDEMPOTENCY_KEY_TTL'] = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+
+# جدول البحث النصي وجداوله الداخلية خارج نماذج SQLAlchemy؛ يستثنى من autogenerate
+SEARCH_INDEX_TABLE = 'product_search'
+
+
+def include_migration_object(obj, name, type_, reflected, compare_to):
+    if type_ == 'table' and reflected and compare_to is None and name.startswith(SEARCH_INDEX_TABLE):
+        return False
+    return True
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """يوجّه استعلامات SELECT في مسارات القراءة إلى النسخة المتماثلة، وكل ما عداها إلى الرئيسية."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and not self._flushing and replica_reads_allowed():
+            return db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+migrate = Migrate(app, db, include_object=include_migration_object)
+
+
+def replica_reads_allowed():
+    if not has_request_context() or not g.get('db_read_replica') or g.get('db_wrote'):
+        return False
+    if session.get('primary_until', 0) > time.time():
+        return False
+    return 'replica' in app.config.get('SQLALCHEMY_BINDS', {})
+
+
+def read_replica(view):
+    """مسار للقراءة فقط: استعلاماته تذهب إلى النسخة المتماثلة إن كانت مضبوطة."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def mark_primary_write():
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def track_orm_write(db_session, flush_context):
+    mark_primary_write()
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def track_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mark_primary_write()
+
+
+@app.after_request
+def stick_to_primary_after_write(response):
+    """قراءة ما كتبه الزائر: بعد أي كتابة تبقى قراءاته على الرئيسية حتى تلحق النسخة المتماثلة."""
+    if g.get('db_wrote') and 'replica' in app.config.get('SQLALCHEMY_BINDS', {}):
+        session['primary_until'] = int(time.time()) + app.config['REPLICA_STICKY_SECONDS']
+    return response
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    """WAL يسمح بالقراءة أثناء الكتابة بين العمال، و synchronous=NORMAL آمن مع WAL وأسرع."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA busy_timeout={int(app.config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    cursor.execute(f"PRAGMA mmap_size={int(app.config['SQLITE_MMAP_SIZE'])}")
+    cursor.close()
 
 # ===== نماذج قاعدة البيانات =====
 
@@ -81,6 +261,11 @@ class AdminUser(db.Model):
 
 
 class AdminActivity(db.Model):
+    __table_args__ = (
+        # سجل النشاط يُعرض دائماً مرتباً بالأحدث، مع تصفية اختيارية حسب المشرف
+        db.Index('ix_admin_activity_admin_id_timestamp', 'admin_id', 'timestamp'),
+        db.Index('ix_admin_activity_timestamp', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     admin_id = db.Column(db.Integer, db.ForeignKey('admin_user.id'), nullable=False)
     action = db.Column(db.String(255), nullable=False)
@@ -91,10 +276,23 @@ class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
     products = db.relationship('Product', backref='category', lazy=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Product(db.Model):
+    __table_args__ = (
+        db.Index('ix_product_stock', 'stock'),
+        # ترتيب قائمة المنتجات حسب السعر والاسم مع id لكسر التعادل (مؤشر الصفحات keyset)
+        db.Index('ix_product_price_id', 'price', 'id'),
+        db.Index('ix_product_name_id', 'name', 'id'),
+        # نفس الترتيبين داخل فئة واحدة
+        db.Index('ix_product_category_id_price_id', 'category_id', 'price', 'id'),
+        db.Index('ix_product_category_id_name_id', 'category_id', 'name', 'id'),
+        # مفتاح الاستيراد الجماعي (ON CONFLICT)؛ المنتجات القديمة بلا sku مسموحة
+        db.Index('ux_product_sku', 'sku', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64), nullable=True)
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text, nullable=True)
@@ -102,38 +300,78 @@ class Product(db.Model):
     image_url = db.Column(db.String(200), default='/static/placeholder.png')
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
     reviews = db.relationship('Review', backref='product', lazy='dynamic')
+    # مجاميع التقييم المخزّنة مسبقاً (تُحدَّث مع كل إضافة/حذف تقييم) لتجنب N+1
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # نسخة المنتج لـ ETag/Last-Modified؛ onupdate يسري أيضاً على UPDATE الجماعي (المخزون والتقييمات)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # {العرض: رابط WebP} تُملأ في الخلفية بعد رفع الصورة
+    image_variants = db.Column(db.JSON(none_as_null=True), nullable=True)
 
     def get_rating_info(self):
-        avg_rating_result = db.session.query(func.avg(Review.rating)).filter(Review.product_id == self.id).scalar()
-        avg_rating = avg_rating_result if avg_rating_result is not None else 0
-        review_count = self.reviews.count()
-        
+        rating_count = self.rating_count or 0
+        avg_rating = (self.rating_sum or 0) / rating_count if rating_count else 0
+
         return {
             'average': round(avg_rating, 2),
-            'count': review_count
+            'count': rating_count
         }
 
-    def to_dict(self):
-        rating_info = self.get_rating_info()
-        return {
-            'id': self.id,
-            'name': self.name,
-            'price': self.price,
-            'description': self.description,
-            'stock': self.stock,
-            'image_url': self.image_url,
-            'category_name': self.category.name if self.category else 'N/A',
-            'rating': rating_info
+    @staticmethod
+    def adjust_rating(product_id, rating_delta, count_delta):
+        """تعديل مجاميع التقييم داخل نفس المعاملة (بدون قراءة ثم كتابة)."""
+        Product.query.filter_by(id=product_id).update({
+            Product.rating_sum: Product.rating_sum + rating_delta,
+            Product.rating_count: Product.rating_count + count_delta
+        }, synchronize_session=False)
+
+    def to_dict(self, fields=None):
+        """تمثيل المنتج؛ fields تحدد الحقول المطلوبة فقط (لا يُقرأ غيرها)."""
+        getters = {
+            'id': lambda: self.id,
+            'sku': lambda: self.sku,
+            'name': lambda: self.name,
+            'price': lambda: self.price,
+            'description': lambda: self.description,
+            'stock': lambda: self.stock,
+            'image_url': lambda: self.image_url,
+            'image_variants': lambda: self.image_variants or {},
+            'category_name': lambda: self.category.name if self.category else 'N/A',
+            'rating': self.get_rating_info
         }
+        return {key: getters[key]() for key in (fields or getters) if key in getters}
+
+
+# الحقول المتاحة في قائمة المنتجات والأعمدة التي يحتاجها كل حقل
+PRODUCT_FIELD_COLUMNS = {
+    'id': ('id',),
+    'sku': ('sku',),
+    'name': ('name',),
+    'price': ('price',),
+    'price_raw': ('price',),
+    'description': ('description',),
+    'stock': ('stock',),
+    'image_url': ('image_url',),
+    'image_variants': ('image_variants',),
+    'category_name': ('category_id',),
+    'rating': ('rating_sum', 'rating_count')
+}
 
 
 class Review(db.Model):
+    __table_args__ = (
+        db.Index('ix_review_product_id_date_posted', 'product_id', 'date_posted'),
+        db.Index('ix_review_date_posted', 'date_posted'),
+        # ترتيب قسم التقييمات في لوحة الإدارة حسب التقييم
+        db.Index('ix_review_rating_id', 'rating', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text, nullable=True)
     reviewer_name = db.Column(db.String(100), default='Anonymous')
     date_posted = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
         return {
@@ -146,6 +384,12 @@ class Review(db.Model):
 
 
 class Order(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_status_date_placed', 'status', 'date_placed'),
+        db.Index('ix_order_date_placed', 'date_placed'),
+        # ترتيب قسم الطلبات في لوحة الإدارة حسب الإجمالي
+        db.Index('ix_order_total_price_id', 'total_price', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_email = db.Column(db.String(100), nullable=False)
@@ -156,11 +400,88 @@ class Order(db.Model):
 
 
 class OrderItem(db.Model):
+    __table_args__ = (
+        db.Index('ix_order_item_order_id', 'order_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     product_name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
+    # مرجع المنتج وفئته وقت الشراء (بدون مفتاح أجنبي حتى يبقى السجل بعد حذف المنتج)
+    product_id = db.Column(db.Integer, nullable=True)
+    category_id = db.Column(db.Integer, nullable=True)
+
+
+class DailySales(db.Model):
+    """مجموع المبيعات المكتملة (Delivered) لكل يوم حسب تاريخ الطلب."""
+    __tablename__ = 'daily_sales'
+    day = db.Column(db.Date, primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+    orders_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyCategorySales(db.Model):
+    """مجموع المبيعات المكتملة لكل يوم ولكل فئة (category_id = 0 للعناصر القديمة بدون فئة)."""
+    __tablename__ = 'daily_category_sales'
+    day = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0)
+
+class CartItem(db.Model):
+    """سطر في سلة محفوظة على الخادم؛ sid هو المعرّف العشوائي المخزّن في الكوكي."""
+    __tablename__ = 'cart_item'
+    __table_args__ = (
+        db.Index('ix_cart_item_updated_at', 'updated_at'),
+    )
+    sid = db.Column(db.String(32), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class FavoriteItem(db.Model):
+    __tablename__ = 'favorite_item'
+    sid = db.Column(db.String(32), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class Job(db.Model):
+    """مهمة في الطابور الخلفي؛ تُضاف ضمن معاملة الطلب وينفذها عامل منفصل (flask worker)."""
+    __tablename__ = 'job'
+    __table_args__ = (
+        # استعلام العامل: المهام المستحقة بترتيب موعدها
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+        db.Index('ux_job_idempotency_key', 'idempotency_key', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    idempotency_key = db.Column(db.String(128), nullable=True)
+    # queued | running | done | failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class IdempotencyRecord(db.Model):
+    """نتيجة طلب نُفذ بمفتاح منع تكرار؛ تكرار نفس الطلب يُعاد توجيهه إليها دون تنفيذ جديد."""
+    __tablename__ = 'idempotency_record'
+    __table_args__ = (
+        db.Index('ix_idempotency_record_created_at', 'created_at'),
+    )
+    # sha256 للنطاق وجلسة الزائر ومفتاح العميل (انظر idempotency_key)
+    key = db.Column(db.String(64), primary_key=True)
+    order_id = db.Column(db.Integer, nullable=True)
+    location = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 # ===== وظائف مساعدة =====
 
@@ -169,41 +490,686 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def write_atomic(path, write):
+    """كتابة ملف عبر ملف مؤقت في نفس المجلد ثم os.replace، فلا يُقرأ ملف نصف مكتوب."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            result = write(out)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return result
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
 def handle_image_upload(file):
-    """حفظ ملف الصورة وإرجاع مساره النسبي."""
+    """حفظ ملف الصورة باسم مشتق من محتواه (sha256) وإرجاع مساره النسبي.
+
+    رفع نفس الصورة مرة أخرى يعيد الملف الموجود بدل تكراره، والأسماء المتشابهة لا تتصادم.
+    """
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            os.makedirs(app.config['UPLOAD_FOLDER'])
-            
-        file.save(filepath)
+        extension = file.filename.rsplit('.', 1)[1].lower()
+        folder = app.config['UPLOAD_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: file.stream.read(64 * 1024), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+            filepath = os.path.join(folder, f'{digest.hexdigest()[:32]}.{extension}')
+            if os.path.exists(filepath):
+                os.remove(tmp_path)
+            else:
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
         return '/' + filepath.replace('\\', '/')
     
     return '/static/placeholder.png'
 
 
+# ===== النسخ المصغرة للصور (WebP) =====
+
+_image_executor_lock = threading.Lock()
+
+
+def image_executor():
+    with _image_executor_lock:
+        executor = app.extensions.get('image_executor')
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'],
+                                          thread_name_prefix='image-variants')
+            app.extensions['image_executor'] = executor
+        return executor
+
+
+def build_image_variants(image_url):
+    """توليد نسخ WebP بالعروض المحددة لصورة مرفوعة وإرجاع {العرض الفعلي: رابط}.
+
+    النسخ الموجودة مسبقاً (نفس المحتوى) لا يُعاد توليدها، ولا تُكبّر الصور الصغيرة.
+    """
+    source = image_url.lstrip('/')
+    if Image is None or not source.startswith(app.config['UPLOAD_FOLDER'] + '/') or not os.path.exists(source):
+        return None
+    stem = os.path.splitext(source)[0]
+    variants = {}
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        # من الأكبر إلى الأصغر: كل نسخة تُصغّر من السابقة بدل الصورة الأصلية الكبيرة
+        for width in IMAGE_VARIANT_WIDTHS:
+            width = min(width, image.width)
+            if str(width) in variants:
+                continue
+            path = f'{stem}-{width}.webp'
+            if not os.path.exists(path):
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+                write_atomic(path, lambda out: image.save(out, 'WEBP', quality=80, method=4))
+            variants[str(width)] = '/' + path
+    return variants
+
+
+def _attach_image_variants(product_id, image_url):
+    with app.app_context():
+        try:
+            variants = build_image_variants(image_url)
+        except Exception:
+            app.logger.exception('تعذر توليد النسخ المصغرة للصورة %s', image_url)
+            return None
+        if variants:
+            # لا نكتب فوق صورة أحدث رُفعت أثناء المعالجة
+            Product.query.filter_by(id=product_id, image_url=image_url).update(
+                {Product.image_variants: variants}, synchronize_session=False)
+            db.session.commit()
+            invalidate_cache(f'product:{product_id}')
+        return variants
+
+
+def process_product_image(product_id, image_url):
+    """جدولة توليد النسخ المصغرة في الخلفية؛ تعيد Future أو None إذا لم يتوفر Pillow."""
+    if Image is None or not image_url:
+        return None
+    return image_executor().submit(_attach_image_variants, product_id, image_url)
+
+
+@app.template_filter('srcset')
+def srcset_filter(variants):
+    return ', '.join(f'{url} {width}w' for width, url in sorted((variants or {}).items(), key=lambda v: int(v[0])))
+
+
+@app.cli.command('build-image-variants')
+def build_image_variants_command():
+    """توليد النسخ المصغرة للمنتجات التي لم تُعالج صورها بعد."""
+    products = Product.query.filter(
+        Product.image_url.like(f"/{app.config['UPLOAD_FOLDER']}/%"),
+        Product.image_variants.is_(None)
+    ).with_entities(Product.id, Product.image_url).all()
+    futures = [process_product_image(product_id, image_url) for product_id, image_url in products]
+    done = sum(1 for future in futures if future and future.result())
+    print(f"تمت معالجة صور {done} من {len(products)} منتج.")
+
+
+# ===== الملفات الثابتة: بصمات المحتوى والضغط المسبق =====
+
+STATIC_MANIFEST = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+FINGERPRINT_RE = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+# الصور المرفوعة تُسمى أصلاً ببصمة محتواها (handle_image_upload) فلا تحتاج manifest
+HASHED_UPLOAD_RE = re.compile(r'(^|/)[0-9a-f]{32}(-\d+)?\.[a-z]+$')
+
+_static_digests = {}
+
+
+def static_manifest():
+    """خريطة الملف -> الاسم ذو البصمة كما بناها 'flask build-assets' (فارغة إن لم تُبن)."""
+    manifest = app.extensions.get('static_manifest')
+    if manifest is None:
+        try:
+            with open(os.path.join(app.static_folder, STATIC_MANIFEST), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        app.extensions['static_manifest'] = manifest
+    return manifest
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def fingerprinted_name(filename):
+    """style.css -> style.<بصمة>.css؛ بدون manifest تُحسب البصمة عند الطلب (بيئة التطوير)."""
+    name = static_manifest().get(filename)
+    if name:
+        return name
+    path = os.path.join(app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return filename
+    key = (filename, stat.st_mtime_ns, stat.st_size)
+    digest = _static_digests.get(key)
+    if digest is None:
+        digest = _static_digests[key] = file_digest(path)
+    stem, ext = os.path.splitext(filename)
+    return f'{stem}.{digest}{ext}'
+
+
+@app.url_defaults
+def fingerprint_static_urls(endpoint, values):
+    filename = values.get('filename')
+    if endpoint == 'static' and filename and app.config['STATIC_FINGERPRINT'] \
+            and not HASHED_UPLOAD_RE.search(filename):
+        values['filename'] = fingerprinted_name(filename)
+
+
+def serve_static(filename):
+    """بديل مسار static: الروابط ذات البصمة تُخدم immutable، مع نسخ .br/.gz المضغوطة إن وُجدت."""
+    immutable = bool(HASHED_UPLOAD_RE.search(filename))
+    match = FINGERPRINT_RE.match(filename)
+    if match and not os.path.isfile(os.path.join(app.static_folder, filename)):
+        filename = match['stem'] + match['ext']
+        # بصمة قديمة (بعد نشر جديد): نخدم المحتوى الحالي دون تخزين طويل
+        immutable = fingerprinted_name(filename) == match['stem'] + '.' + match['digest'] + match['ext']
+
+    path = os.path.join(app.static_folder, filename)
+    served, encoding, has_siblings = filename, None, False
+    if os.path.splitext(filename)[1] in COMPRESSIBLE_EXTENSIONS and os.path.isfile(path):
+        source_mtime = os.path.getmtime(path)
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            sibling = path + suffix
+            if os.path.isfile(sibling) and os.path.getmtime(sibling) >= source_mtime:
+                has_siblings = True
+                if encoding is None and candidate in request.accept_encodings:
+                    served, encoding = filename + suffix, candidate
+
+    options = {'max_age': app.config['STATIC_IMMUTABLE_MAX_AGE']} if immutable else {}
+    response = send_from_directory(app.static_folder, served, mimetype=mimetypes.guess_type(filename)[0], **options)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if has_siblings:
+        response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+app.view_functions['static'] = serve_static
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """بناء manifest البصمات ونسخ gzip/brotli المضغوطة مسبقاً لملفات static."""
+    manifest = {}
+    compressed = 0
+    for root, dirs, files in os.walk(app.static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])]
+        for name in files:
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1]
+            if filename == STATIC_MANIFEST or ext in ('.gz', '.br') or HASHED_UPLOAD_RE.search(filename):
+                continue
+            stem = filename[:-len(ext)] if ext else filename
+            manifest[filename] = f'{stem}.{file_digest(path)}{ext}'
+            if ext in COMPRESSIBLE_EXTENSIONS:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                write_atomic(path + '.gz', lambda out: out.write(gzip.compress(data, 9, mtime=0)))
+                if brotli is not None:
+                    write_atomic(path + '.br', lambda out: out.write(brotli.compress(data)))
+                compressed += 1
+    write_atomic(os.path.join(app.static_folder, STATIC_MANIFEST),
+                 lambda out: out.write(json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')))
+    app.extensions.pop('static_manifest', None)
+    print(f"تم بناء بصمات {len(manifest)} ملف وضغط {compressed} ملف مسبقاً.")
+
+# ===== فهرس البحث النصي (SQLite FTS5) =====
+
+product_search_table = sa_table(
+    SEARCH_INDEX_TABLE,
+    sa_column('rowid'),
+    sa_column('rank'),
+    sa_column(SEARCH_INDEX_TABLE)
+)
+
+_search_index_state = {}
+
+
+def search_index_available():
+    """هل فهرس FTS5 موجود على قاعدة البيانات الحالية؟ (تُحفظ النتيجة لكل محرك)"""
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return False
+    key = str(engine.url)
+    if key not in _search_index_state:
+        found = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_INDEX_TABLE}
+        ).scalar()
+        _search_index_state[key] = bool(found)
+    return _search_index_state[key]
+
+
+def ensure_search_index():
+    """إنشاء جدول FTS5 إن لم يكن موجوداً. يعيد False إذا كانت القاعدة لا تدعمه."""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    db.session.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_INDEX_TABLE} USING fts5("
+        "name, description, category_name, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    # ترتيب الصلة: الاسم أهم من الفئة، والفئة أهم من الوصف
+    db.session.execute(text(
+        f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0, 3.0)')"
+    ))
+    db.session.commit()
+    _search_index_state.pop(str(db.engine.url), None)
+    return True
+
+
+def rebuild_search_index():
+    """إعادة بناء فهرس البحث بالكامل من جدولي المنتجات والفئات."""
+    if not ensure_search_index():
+        return 0
+    db.session.execute(text(f"DELETE FROM {SEARCH_INDEX_TABLE}"))
+    result = db.session.execute(text(
+        f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, name, description, category_name) "
+        "SELECT product.id, product.name, COALESCE(product.description, ''), COALESCE(category.name, '') "
+        "FROM product LEFT JOIN category ON category.id = product.category_id"
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def index_product(product):
+    """تحديث سطر المنتج في فهرس البحث (ضمن المعاملة الحالية)."""
+    if not search_index_available():
+        return
+    category = db.session.get(Category, product.category_id) if product.category_id else None
+    unindex_product(product.id)
+    db.session.execute(
+        text(f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, name, description, category_name) "
+             "VALUES (:id, :name, :description, :category_name)"),
+        {
+            'id': product.id,
+            'name': product.name or '',
+            'description': product.description or '',
+            'category_name': category.name if category else ''
+        }
+    )
+
+
+def reindex_products(product_ids):
+    """إعادة فهرسة مجموعة منتجات بأمرين بدل أمرين لكل منتج (بعد الاستيراد الجماعي)."""
+    if not product_ids or not search_index_available():
+        return
+    ids = bindparam('ids', expanding=True)
+    db.session.execute(text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid IN :ids").bindparams(ids),
+                       {'ids': product_ids})
+    db.session.execute(text(
+        f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, name, description, category_name) "
+        "SELECT product.id, product.name, COALESCE(product.description, ''), COALESCE(category.name, '') "
+        "FROM product LEFT JOIN category ON category.id = product.category_id WHERE product.id IN :ids"
+    ).bindparams(ids), {'ids': product_ids})
+
+
+def unindex_product(product_id):
+    if not search_index_available():
+        return
+    db.session.execute(text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid = :id"), {'id': product_id})
+
+
+def build_match_query(term):
+    """تحويل نص البحث إلى استعلام FTS5 بمطابقة البادئة لكل كلمة."""
+    tokens = re.findall(r'\w+', term or '', re.UNICODE)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """إعادة بناء فهرس البحث النصي للمنتجات."""
+    count = rebuild_search_index()
+    print(f"تمت فهرسة {count} منتج.")
+
+
+def encode_cursor(values):
+    """ترميز مؤشر الصفحات (keyset) كنص base64 مختصر."""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=2):
+    """فك ترميز المؤشر؛ يعيد None إذا كان غير صالح."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def parse_product_fields(raw):
+    """قراءة معامل fields=؛ يعيد None إذا طُلب حقل غير معروف."""
+    if not raw:
+        return list(PRODUCT_FIELD_COLUMNS)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    if any(f not in PRODUCT_FIELD_COLUMNS for f in fields):
+        return None
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def product_load_options(fields):
+    """تحميل الأعمدة اللازمة للحقول المطلوبة فقط (بدون الوصف الطويل مثلاً)."""
+    columns = {column for f in fields for column in PRODUCT_FIELD_COLUMNS[f]}
+    # updated_at دائماً: منه يُحسب ETag القائمة
+    columns.add('updated_at')
+    options = [load_only(*[getattr(Product, column) for column in sorted(columns)])]
+    if 'category_name' in fields:
+        options.append(joinedload(Product.category))
+    return options
+
+
+def dialect_insert(model):
+    """INSERT يدعم ON CONFLICT حسب نوع قاعدة البيانات (SQLite أو PostgreSQL)."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def upsert_increment(model, keys, increments):
+    """إضافة قيم إلى سطر تجميعي (أو إنشاؤه) في أمر واحد."""
+    stmt = dialect_insert(model).values(**keys, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: getattr(model, name) + stmt.excluded[name] for name in increments}
+    )
+    db.session.execute(stmt)
+
+
+# ===== تجميع المبيعات (daily_sales) =====
+
+SALES_STATUS = 'Delivered'
+
+
+def apply_sales_rollup(order, sign):
+    """إضافة (sign=1) أو طرح (sign=-1) طلب من جداول التجميع اليومية."""
+    day = order.date_placed.date()
+    upsert_increment(DailySales, {'day': day}, {'total': sign * order.total_price, 'orders_count': sign})
+
+    per_category = defaultdict(float)
+    for item in order.items:
+        per_category[item.category_id or 0] += item.price * item.quantity
+    for category_id, amount in per_category.items():
+        upsert_increment(DailyCategorySales, {'day': day, 'category_id': category_id}, {'total': sign * amount})
+
+
+def rebuild_sales_rollup():
+    """إعادة حساب جداول التجميع بالكامل من الطلبات (للتصحيح أو بعد الاستيراد)."""
+    DailyCategorySales.query.delete()
+    DailySales.query.delete()
+    db.session.execute(text(
+        'INSERT INTO daily_sales (day, total, orders_count) '
+        'SELECT date(date_placed), SUM(total_price), COUNT(*) FROM "order" '
+        'WHERE status = :status GROUP BY date(date_placed)'
+    ), {'status': SALES_STATUS})
+    db.session.execute(text(
+        'INSERT INTO daily_category_sales (day, category_id, total) '
+        'SELECT date(o.date_placed), COALESCE(i.category_id, 0), SUM(i.price * i.quantity) '
+        'FROM order_item i JOIN "order" o ON o.id = i.order_id '
+        'WHERE o.status = :status GROUP BY date(o.date_placed), COALESCE(i.category_id, 0)'
+    ), {'status': SALES_STATUS})
+    db.session.commit()
+    sales_stats_cache.invalidate('sales')
+
+
+def total_delivered_sales():
+    """إجمالي المبيعات المكتملة؛ يُحفظ في sales_stats_cache ويُبطل مع كل تغيير في التجميع."""
+    total = sales_stats_cache.get('total_delivered', 'total_delivered_sales')
+    if total is None:
+        total = db.session.query(func.sum(DailySales.total)).scalar()
+        total = round(total or 0, 2)
+        sales_stats_cache.set('total_delivered', total, ('sales',))
+    return total
+
+
+def shift_month(day, months):
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def parse_date_arg(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def sales_report(date_from=None, date_to=None, category_id=None):
+    """المبيعات الشهرية بين تاريخين (افتراضياً آخر 12 شهراً) من جدول التجميع."""
+    date_to = date_to or date.today()
+    date_from = date_from or shift_month(date_to, -11)
+
+    model = DailySales if category_id is None else DailyCategorySales
+    q = db.session.query(model.day, model.total).filter(model.day >= date_from, model.day <= date_to)
+    if category_id is not None:
+        q = q.filter(DailyCategorySales.category_id == category_id)
+
+    totals = defaultdict(float)
+    for day, total in q:
+        totals[day.strftime('%Y-%m')] += total
+
+    labels = []
+    month = date(date_from.year, date_from.month, 1)
+    while month <= date_to:
+        labels.append(month.strftime('%Y-%m'))
+        month = shift_month(month, 1)
+    return labels, [round(totals[label], 2) for label in labels]
+
+
+def sales_by_category(date_from=None, date_to=None):
+    """توزيع المبيعات على الفئات في الفترة المحددة (استعلام تجميعي واحد)."""
+    q = db.session.query(
+        DailyCategorySales.category_id, func.sum(DailyCategorySales.total)
+    ).group_by(DailyCategorySales.category_id)
+    if date_from:
+        q = q.filter(DailyCategorySales.day >= date_from)
+    if date_to:
+        q = q.filter(DailyCategorySales.day <= date_to)
+    rows = q.all()
+    names = dict(db.session.query(Category.id, Category.name).filter(
+        Category.id.in_([category_id for category_id, _ in rows])
+    ).all())
+    return [
+        {'category_id': category_id, 'category_name': names.get(category_id, 'غير محدد'), 'total': round(total or 0, 2)}
+        for category_id, total in rows
+    ]
+
+
+@app.cli.command('rebuild-sales-rollup')
+def rebuild_sales_rollup_command():
+    """إعادة حساب جداول تجميع المبيعات اليومية من الطلبات."""
+    rebuild_sales_rollup()
+    print(f"إجمالي المبيعات المكتملة: {total_delivered_sales()}")
+
+
+# ===== محرك العملات =====
+
+class CurrencyEngine:
+    """تحويل الأسعار وتنسيقها بـ Decimal مع تقريب كل عملة حسب خاناتها العشرية.
+
+    النص المنسق لكل (عملة، سعر) يُحسب مرة ويُحفظ. الجدول وذاكرته زوج واحد (specs, memo) يُستبدل
+    معاً عند التحميل، و format يقرأ الزوج مرة واحدة ويحسب ويخزن فيه فقط، فلا يدخل نص محسوب
+    بمعدل قديم إلى ذاكرة الجدول الجديد.
+    """
+
+    def __init__(self, max_cached=50000):
+        self.max_cached = max_cached
+        self.version = 0
+        self._state = ({}, {})
+        self._lock = threading.Lock()
+        self._source_mtime = None
+        self._next_check = 0
+
+    def load(self, rates, symbols=None, positions=None, decimals=None, required=None):
+        """تحميل جدول كامل؛ القيم إما معدل رقمي أو قاموس {rate, symbol, position, decimals}.
+
+        required: عملات يجب أن يحويها الجدول (افتراضياً DEFAULT_CURRENCY)، وإلا ValueError ويبقى الجدول الحالي.
+        """
+        if required is None:
+            required = (app.config['DEFAULT_CURRENCY'],)
+        missing = [code for code in required if code not in rates]
+        if missing:
+            raise ValueError(f"الجدول لا يحوي العملة {', '.join(missing)}")
+        symbols, positions, decimals = symbols or {}, positions or {}, decimals or {}
+        current = self._state[0]
+        specs = {}
+        for code, value in rates.items():
+            if not isinstance(value, dict):
+                value = {'rate': value}
+            previous = current.get(code, {})
+            rate = Decimal(str(value['rate']))
+            if not rate.is_finite() or rate <= 0:
+                raise ValueError(f'سعر صرف غير صالح للعملة {code}')
+            places = int(value.get('decimals', decimals.get(code, previous.get('places', 2))))
+            specs[code] = {
+                'rate': rate,
+                'symbol': value.get('symbol', symbols.get(code, previous.get('symbol', ''))),
+                'position': value.get('position', positions.get(code, previous.get('position', 'prefix'))),
+                'places': places,
+                'quantum': Decimal(1).scaleb(-places)
+            }
+        with self._lock:
+            self._state = (specs, {})
+            self.version += 1
+
+    def load_file(self, path, required=None):
+        with open(path, encoding='utf-8') as f:
+            self.load(json.load(f), required=required)
+        self._source_mtime = os.path.getmtime(path)
+
+    def save_file(self, path, table):
+        """حفظ جدول (بعد load) في الملف لتلتقطه العمليات الأخرى."""
+        write_atomic(path, lambda out: out.write(json.dumps(table, ensure_ascii=False, indent=2).encode('utf-8')))
+        self._source_mtime = os.path.getmtime(path)
+
+    def reload_if_changed(self, path, interval):
+        """يعيد True إذا أُعيد تحميل الملف (يُفحص مرة كل interval ثانية على الأكثر)."""
+        now = time.monotonic()
+        if not path or now < self._next_check:
+            return False
+        self._next_check = now + interval
+        try:
+            if not os.path.exists(path):
+                return False
+            mtime = os.path.getmtime(path)
+            if mtime == self._source_mtime:
+                return False
+            # يُسجل قبل التحميل: الملف المعطوب لا يُعاد تحليله في كل فحص بل بعد تعديله فقط
+            self._source_mtime = mtime
+            self.load_file(path)
+        except (OSError, ValueError, KeyError, InvalidOperation):
+            app.logger.exception('تعذر تحميل ملف أسعار العملات %s', path)
+            return False
+        return True
+
+    @property
+    def currencies(self):
+        return self._state[0]
+
+    def fingerprint(self, currency):
+        """ما يؤثر في نص السعر لهذه العملة (متطابق بين العمليات، بخلاف version)."""
+        spec = self._state[0].get(currency, {})
+        return (str(spec.get('rate')), spec.get('symbol'), spec.get('position'), spec.get('places'))
+
+    @staticmethod
+    def _convert(amount, spec):
+        value = Decimal(str(amount or 0))
+        if spec is None:
+            return value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        return (value * spec['rate']).quantize(spec['quantum'], rounding=ROUND_HALF_UP)
+
+    def convert(self, amount, currency):
+        return self._convert(amount, self._state[0].get(currency))
+
+    def _format(self, amount, currency, spec, formatted):
+        key = (currency, amount)
+        text_value = formatted.get(key)
+        if text_value is None:
+            converted = self._convert(amount, spec)
+            symbol = spec['symbol'] if spec else ''
+            if not spec or spec['position'] == 'prefix':
+                text_value = f"{symbol}{converted}"
+            else:
+                text_value = f"{converted} {symbol}"
+            if len(formatted) >= self.max_cached:
+                formatted.clear()
+            formatted[key] = text_value
+        return text_value
+
+    def format(self, amount, currency):
+        specs, formatted = self._state
+        return self._format(amount, currency, specs.get(currency), formatted)
+
+    def format_many(self, amounts, currency):
+        specs, formatted = self._state
+        spec = specs.get(currency)
+        return [self._format(amount, currency, spec, formatted) for amount in amounts]
+
+
+currency_engine = CurrencyEngine()
+currency_engine.load(app.config['CURRENCY_RATES'], app.config['CURRENCY_SYMBOLS'],
+                     app.config['CURRENCY_POSITION'], app.config['CURRENCY_DECIMALS'])
+if app.config['CURRENCY_RATES_FILE'] and os.path.exists(app.config['CURRENCY_RATES_FILE']):
+    currency_engine.load_file(app.config['CURRENCY_RATES_FILE'])
+
+
+def current_currency_engine():
+    """المحرك بعد التحقق من ملف الأسعار؛ عند تغيّره تُفرغ ذاكرة الاستجابات لأنها تحوي أسعاراً قديمة."""
+    if currency_engine.reload_if_changed(app.config['CURRENCY_RATES_FILE'], app.config['CURRENCY_RATES_CHECK_INTERVAL']):
+        response_cache.clear()
+    return currency_engine
+
+
 def get_current_currency():
-    return session.get('currency', app.config.get('DEFAULT_CURRENCY', 'USD'))
+    currency = session.get('currency', app.config.get('DEFAULT_CURRENCY', 'USD'))
+    return currency if currency in currency_engine.currencies else app.config.get('DEFAULT_CURRENCY', 'USD')
 
 
 def convert_price(amount, to_currency):
-    try:
-        rate = app.config['CURRENCY_RATES'].get(to_currency, 1.0)
-    except Exception:
-        rate = 1.0
-    return amount * rate
+    return float(current_currency_engine().convert(amount, to_currency))
 
 
 def format_price(amount):
-    cur = get_current_currency()
-    converted = convert_price(amount, cur)
-    symbol = app.config['CURRENCY_SYMBOLS'].get(cur, '')
-    pos = app.config['CURRENCY_POSITION'].get(cur, 'prefix')
-    if pos == 'prefix':
-        return f"{symbol}{converted:.2f}"
-    return f"{converted:.2f} {symbol}"
+    return current_currency_engine().format(amount, get_current_currency())
+
+
+def format_prices(amounts):
+    """تنسيق دفعة أسعار بعملة الجلسة (قراءة الجلسة وفحص الجدول مرة واحدة)."""
+    return current_currency_engine().format_many(amounts, get_current_currency())
 
 
 @app.context_processor
@@ -216,7 +1182,7 @@ def inject_currency_helpers():
 
 @app.route('/set_currency/<currency_code>')
 def set_currency(currency_code):
-    if currency_code in app.config.get('CURRENCY_RATES', {}):
+    if currency_code in current_currency_engine().currencies:
         session['currency'] = currency_code
     # If called via AJAX, return JSON; otherwise redirect back
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' or request.args.get('ajax') == '1':
@@ -224,55 +1190,283 @@ def set_currency(currency_code):
     return redirect(request.referrer or url_for('home'))
 
 
+@app.route('/admin/currency_rates', methods=['GET', 'POST'])
+def admin_currency_rates():
+    """عرض جدول العملات أو استبداله أثناء التشغيل.
+
+    مع CURRENCY_RATES_FILE يُكتب الجدول في الملف فتلتقطه بقية العمليات خلال فترة الفحص.
+    """
+    denied = admin_api_denied('products')
+    if denied:
+        return denied
+
+    engine = current_currency_engine()
+    if request.method == 'POST':
+        table = request.get_json(silent=True)
+        if not isinstance(table, dict) or not table:
+            return jsonify({'error': 'invalid_rates'}), 400
+        try:
+            # بدون العملة الافتراضية تُعرض الأسعار لمن لم يختر عملة بلا رمز ولا تحويل
+            engine.load(table)
+        except (TypeError, ValueError, KeyError, InvalidOperation) as exc:
+            return jsonify({'error': 'invalid_rates', 'message': str(exc)}), 400
+        if app.config['CURRENCY_RATES_FILE']:
+            engine.save_file(app.config['CURRENCY_RATES_FILE'], table)
+        response_cache.clear()
+
+    return jsonify({
+        'version': engine.version,
+        'currencies': {code: {'rate': str(spec['rate']), 'symbol': spec['symbol'], 'position': spec['position'],
+                              'decimals': spec['places']} for code, spec in engine.currencies.items()}
+    })
+
+
+PRICING_DATA_MAX_IDS = 500
+
+
+def parse_id_list(value, limit=PRICING_DATA_MAX_IDS):
+    """'1,2,3' -> [1, 2, 3] بلا تكرار، مع تجاهل القيم غير الرقمية وحد أقصى للعدد."""
+    ids = {}
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part.isdigit():
+            ids[int(part)] = None
+            if len(ids) >= limit:
+                break
+    return list(ids)
+
+
 @app.route('/admin/pricing_data')
 def admin_pricing_data():
-    # Return formatted prices for products, orders and stats (used by admin UI for dynamic updates)
+    """إعادة تنسيق الأسعار الظاهرة فقط عند تبديل العملة.
+
+    الواجهة ترسل product_ids وorder_ids المعروضة (بحد أقصى PRICING_DATA_MAX_IDS لكل نوع)،
+    ويُعاد معها جدول العملة الحالية ليتمكن العميل من التنسيق بنفسه من الأسعار الخام.
+    """
     if 'admin_id' not in session:
         return jsonify({'error': 'unauthenticated'}), 401
 
-    # products
-    products = Product.query.all()
-    products_data = []
-    for p in products:
-        try:
-            products_data.append({'id': p.id, 'price_display': format_price(p.price)})
-        except Exception:
-            products_data.append({'id': p.id, 'price_display': p.price})
+    product_ids = parse_id_list(request.args.get('product_ids'))
+    order_ids = parse_id_list(request.args.get('order_ids'))
 
-    # orders
-    orders = Order.query.all()
-    orders_data = []
-    for o in orders:
-        try:
-            orders_data.append({'id': o.id, 'total_display': format_price(o.total_price)})
-        except Exception:
-            orders_data.append({'id': o.id, 'total_display': o.total_price})
+    products = db.session.query(Product.id, Product.price).filter(Product.id.in_(product_ids)).all() if product_ids else []
+    products_data = [{'id': product_id, 'price': price, 'price_display': display} for (product_id, price), display
+                     in zip(products, format_prices([price for _, price in products]))]
 
-    # stats: compute total_sales similar to admin_panel
-    total_sales_result = db.session.query(func.sum(Order.total_price)).filter_by(status='Delivered').scalar()
-    total_sales = round(total_sales_result or 0, 2)
-    try:
-        total_sales_display = format_price(total_sales)
-    except Exception:
-        total_sales_display = total_sales
+    orders = db.session.query(Order.id, Order.total_price).filter(Order.id.in_(order_ids)).all() if order_ids else []
+    orders_data = [{'id': order_id, 'total': total, 'total_display': display} for (order_id, total), display
+                   in zip(orders, format_prices([total for _, total in orders]))]
+
+    code = get_current_currency()
+    spec = current_currency_engine().currencies.get(code, {})
 
     return jsonify({
+        'currency': {'code': code, 'rate': str(spec.get('rate', 1)), 'symbol': spec.get('symbol', ''),
+                     'position': spec.get('position', 'prefix'), 'decimals': spec.get('places', 2)},
         'products': products_data,
         'orders': orders_data,
-        'stats': {'total_sales_display': total_sales_display}
+        'stats': {'total_sales_display': format_price(total_delivered_sales())}
     })
 
 
-def get_cart_details():
-    """يحصل على تفاصيل سلة المشتريات من الجلسة."""
-    if 'cart' not in session:
-        session['cart'] = {}
+@app.route('/admin/sales_data')
+@read_replica
+def admin_sales_data():
+    """بيانات الرسم البياني للمبيعات مع فترة زمنية وفئة اختيارية."""
+    if 'admin_id' not in session:
+        return jsonify({'error': 'unauthenticated'}), 401
+
+    date_from = parse_date_arg(request.args.get('from'))
+    date_to = parse_date_arg(request.args.get('to'))
+    category_id = request.args.get('category_id', type=int)
+    labels, data = sales_report(date_from, date_to, category_id)
+
+    return jsonify({
+        'labels': labels,
+        'data': data,
+        'by_category': sales_by_category(date_from, date_to)
+    })
+
+
+# ===== تخزين السلة والمفضلة على الخادم =====
+
+class DatabaseCartStore:
+    """السلة والمفضلة في جداول cart_item / favorite_item (سطر لكل منتج، تحديث O(1))."""
+
+    def get_cart(self, sid):
+        rows = db.session.query(CartItem.product_id, CartItem.quantity).filter(CartItem.sid == sid)
+        return {product_id: quantity for product_id, quantity in rows}
+
+    def get_quantity(self, sid, product_id):
+        quantity = db.session.query(CartItem.quantity).filter_by(sid=sid, product_id=product_id).scalar()
+        return quantity or 0
+
+    def add_to_cart(self, sid, product_id, quantity):
+        stmt = dialect_insert(CartItem).values(
+            sid=sid, product_id=product_id, quantity=quantity, updated_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sid', 'product_id'],
+            set_={'quantity': CartItem.quantity + stmt.excluded.quantity, 'updated_at': stmt.excluded.updated_at}
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+    def cart_count(self, sid):
+        total = db.session.query(func.sum(CartItem.quantity)).filter(CartItem.sid == sid).scalar()
+        return total or 0
+
+    def clear_cart(self, sid):
+        CartItem.query.filter_by(sid=sid).delete()
+        db.session.commit()
+
+    def get_favorites(self, sid):
+        rows = db.session.query(FavoriteItem.product_id).filter(FavoriteItem.sid == sid).order_by(FavoriteItem.created_at)
+        return [product_id for (product_id,) in rows]
+
+    def favorites_count(self, sid):
+        return FavoriteItem.query.filter_by(sid=sid).count()
+
+    def toggle_favorite(self, sid, product_id):
+        """يعيد True إذا أُضيف المنتج، False إذا أُزيل."""
+        removed = FavoriteItem.query.filter_by(sid=sid, product_id=product_id).delete()
+        if not removed:
+            # نقرتان متزامنتان قد تضيفان نفس السطر؛ الثانية تجده موجوداً فتعتبره مضافاً
+            db.session.execute(
+                dialect_insert(FavoriteItem).values(sid=sid, product_id=product_id, created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=['sid', 'product_id'])
+            )
+        db.session.commit()
+        return not removed
+
+
+class MemoryCartStore:
+    """مخزن داخل العملية (للتطوير أو خادم بعملية واحدة)؛ يُفقد عند إعادة التشغيل."""
+
+    def __init__(self):
+        self._carts = {}
+        self._favorites = {}
+        self._lock = threading.Lock()
+
+    def get_cart(self, sid):
+        with self._lock:
+            return dict(self._carts.get(sid, {}))
+
+    def get_quantity(self, sid, product_id):
+        return self._carts.get(sid, {}).get(product_id, 0)
+
+    def add_to_cart(self, sid, product_id, quantity):
+        with self._lock:
+            cart = self._carts.setdefault(sid, {})
+            cart[product_id] = cart.get(product_id, 0) + quantity
+
+    def cart_count(self, sid):
+        return sum(self._carts.get(sid, {}).values())
+
+    def clear_cart(self, sid):
+        with self._lock:
+            self._carts.pop(sid, None)
+
+    def get_favorites(self, sid):
+        return list(self._favorites.get(sid, {}))
+
+    def favorites_count(self, sid):
+        return len(self._favorites.get(sid, {}))
+
+    def toggle_favorite(self, sid, product_id):
+        with self._lock:
+            # dict يحفظ ترتيب الإضافة ويعطي حذفاً/إضافة O(1)
+            favorites = self._favorites.setdefault(sid, {})
+            if product_id in favorites:
+                del favorites[product_id]
+                return False
+            favorites[product_id] = True
+            return True
+
+
+CART_STORES = {
+    'database': DatabaseCartStore,
+    'memory': MemoryCartStore
+}
+
+
+def cart_store():
+    store = app.extensions.get('cart_store')
+    if store is None:
+        store = CART_STORES[app.config['CART_STORE']]()
+        app.extensions['cart_store'] = store
+    return store
+
+
+def cart_session_id(create=False):
+    """معرّف السلة في الكوكي؛ يُنشأ عند أول كتابة فقط.
+
+    الجلسات القديمة التي تحمل 'cart'/'favorites' داخل الكوكي تُنقل إلى المخزن مرة واحدة.
+    """
+    sid = session.get('cart_sid')
+    legacy_cart = session.pop('cart', None)
+    legacy_favorites = session.pop('favorites', None)
+
+    if sid is None and (create or legacy_cart or legacy_favorites):
+        sid = secrets.token_hex(16)
+        session['cart_sid'] = sid
+
+    if legacy_cart or legacy_favorites:
+        store = cart_store()
+        for product_id, quantity in (legacy_cart or {}).items():
+            store.add_to_cart(sid, int(product_id), int(quantity))
+        existing = set(store.get_favorites(sid))
+        for product_id in legacy_favorites or []:
+            if int(product_id) not in existing:
+                store.toggle_favorite(sid, int(product_id))
+    return sid
+
+
+def current_cart():
+    """قاموس product_id -> الكمية لسلة الزائر الحالي."""
+    sid = cart_session_id()
+    return cart_store().get_cart(sid) if sid else {}
+
+
+def current_favorites():
+    sid = cart_session_id()
+    return cart_store().get_favorites(sid) if sid else []
+
+
+@app.cli.command('purge-carts')
+@click.option('--days', default=30, show_default=True, help='حذف السلال التي لم تُعدّل منذ هذا العدد من الأيام')
+def purge_carts_command(days):
+    """حذف السلال المهجورة من جدول cart_item."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = CartItem.query.filter(CartItem.updated_at < cutoff).delete()
+    db.session.commit()
+    print(f"تم حذف {deleted} سطر من السلال المهجورة.")
+
+
+def load_cart_products(cart):
+    """تحميل كل منتجات السلة باستعلام IN واحد (قاموس id -> Product)."""
+    product_ids = {int(product_id) for product_id in cart}
+    if not product_ids:
+        return {}
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    return {p.id: p for p in products}
+
+
+def get_cart_details(products=None, cart=None):
+    """يحصل على تفاصيل سلة المشتريات من مخزن السلة.
+
+    products: نتيجة load_cart_products إن كانت محمّلة مسبقاً (لإعادة استخدامها في الدفع).
+    """
+    if cart is None:
+        cart = current_cart()
+    if products is None:
+        products = load_cart_products(cart)
     
     cart_items = []
     total_price = 0
     
-    for product_id, quantity in session['cart'].items():
-        product = Product.query.get(int(product_id))
+    for product_id, quantity in cart.items():
+        product = products.get(int(product_id))
         if product:
             item_total = product.price * quantity
             total_price += item_total
@@ -281,79 +1475,825 @@ def get_cart_details():
                 'name': product.name,
                 'price': product.price,
                 'quantity': quantity,
-                'item_total': item_total
+                'item_total': item_total,
+                'stock': product.stock
             })
     
     return cart_items, total_price
 
 
+def quote_cart(cart, products):
+    """تسعير سلة كاملة: إجماليات الأسطر والإجمالي المحوّل وتحذيرات المخزون."""
+    currency = get_current_currency()
+    lines = []
+    warnings = []
+    total_price = 0
+
+    for product_id, quantity in cart.items():
+        product_id = int(product_id)
+        product = products.get(product_id)
+        if not product:
+            warnings.append({'product_id': product_id, 'code': 'unavailable', 'requested': quantity})
+            continue
+
+        line_total = product.price * quantity
+        total_price += line_total
+        lines.append({
+            'product_id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'price_display': format_price(product.price),
+            'quantity': quantity,
+            'line_total': line_total,
+            'line_total_display': format_price(line_total)
+        })
+        if product.stock <= 0:
+            warnings.append({'product_id': product.id, 'code': 'out_of_stock', 'requested': quantity, 'available': 0})
+        elif product.stock < quantity:
+            warnings.append({'product_id': product.id, 'code': 'insufficient_stock', 'requested': quantity, 'available': product.stock})
+
+    return {
+        'lines': lines,
+        'warnings': warnings,
+        'total': total_price,
+        'currency': currency,
+        'total_converted': round(convert_price(total_price, currency), 2),
+        'total_display': format_price(total_price)
+    }
+
+
 def get_favorites_details():
-    """يحصل على تفاصيل المنتجات المفضلة من الجلسة."""
-    favorites_ids = [int(id) for id in session.get('favorites', [])]
-    favorite_products = Product.query.filter(Product.id.in_(favorites_ids)).all()
+    """يحصل على تفاصيل المنتجات المفضلة من مخزن المفضلة."""
+    favorites_ids = current_favorites()
+    favorite_products = Product.query.options(joinedload(Product.category)).filter(Product.id.in_(favorites_ids)).all()
     
     return [p.to_dict() for p in favorite_products]
 
+# ===== ذاكرة مؤقتة للاستجابات العامة =====
+
+class ResponseCache:
+    """LRU محدود الحجم مع TTL، وكل مدخل يحمل وسوماً (tags) لإبطاله بدقة.
+
+    أمثلة الوسوم: 'catalog' لقوائم المنتجات، 'categories' للصفحة الرئيسية،
+    'product:<id>' لكل صفحة أو قائمة تعرض هذا المنتج.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        self._keys_by_tag = defaultdict(set)
+        self._lock = threading.Lock()
+        self.counters = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self.invalidations = 0
+        self.evictions = 0
+
+    def get(self, key, endpoint):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.counters[endpoint]['hits'] += 1
+                return entry[2]
+            if entry is not None:
+                self._remove(key)
+            self.counters[endpoint]['misses'] += 1
+            return None
+
+    def set(self, key, value, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tags, value)
+            for tag in tags:
+                self._keys_by_tag[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def _remove(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def stats(self):
+        with self._lock:
+            hits = sum(c['hits'] for c in self.counters.values())
+            misses = sum(c['misses'] for c in self.counters.values())
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+                'endpoints': {endpoint: dict(c) for endpoint, c in self.counters.items()}
+            }
+
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'], app.config['RESPONSE_CACHE_TTL'])
+# مجاميع لوحة التحكم (بالعملة الأساسية، فلا تتأثر بتبديل العملة)
+sales_stats_cache = ResponseCache(max_entries=16, ttl=300)
+
+
+def add_cache_tags(*tags):
+    """وسوم إضافية للاستجابة الحالية تُعرف أثناء التنفيذ (مثل منتجات الصفحة)."""
+    g.setdefault('cache_tags', set()).update(tags)
+
+
+def invalidate_cache(*tags):
+    response_cache.invalidate(*tags)
+
+
+def cached_response(*tag_templates):
+    """تخزين استجابة GET ناجحة حسب المسار ووسائطه والعملة الحالية.
+
+    tag_templates تُملأ من وسائط المسار، مثل 'product:{product_id}'.
+    لا تُخزن الصفحات التي تحمل رسائل flash لأنها خاصة بالزائر.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not app.config['RESPONSE_CACHE_ENABLED'] or '_flashes' in session:
+                return view(**kwargs)
+
+            key = (
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                get_current_currency()
+            )
+            cached = response_cache.get(key, request.endpoint)
+            if cached is not None:
+                body, status, content_type, headers = cached
+                response = app.response_class(body, status=status, content_type=content_type, headers=headers)
+                etag, _ = response.get_etag()
+                if etag and is_not_modified(etag, response.last_modified):
+                    response = app.response_class(status=304, headers=headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = app.make_response(view(**kwargs))
+            if response.status_code == 200 and not response.direct_passthrough:
+                tags = {template.format(**kwargs) for template in tag_templates}
+                tags.update(g.pop('cache_tags', ()))
+                headers = [(name, value) for name, value in response.headers.items() if name in VALIDATOR_HEADERS]
+                response_cache.set(key, (response.get_data(), response.status_code, response.content_type, headers), tags)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+@app.route('/admin/cache_stats')
+def admin_cache_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'unauthenticated'}), 401
+    return jsonify(response_cache.stats())
+
+# ===== الطلبات الشرطية (ETag / Last-Modified) =====
+
+VALIDATOR_HEADERS = ('ETag', 'Last-Modified', 'Vary', 'Cache-Control')
+
+
+def version_etag(*parts):
+    """ETag قوي من نسخ السجلات (updated_at) ومعاملات الطلب، دون الحاجة لتسلسل الجسم."""
+    currency = get_current_currency()
+    parts += (currency, current_currency_engine().fingerprint(currency))
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def latest_version(*timestamps):
+    return max((t for t in timestamps if t is not None), default=None)
+
+
+def is_not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(microsecond=0, tzinfo=None) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional_response(etag, last_modified, render):
+    """304 قبل بناء الجسم إذا طابقت نسخة العميل، وإلا render() مع ETag/Last-Modified.
+
+    last_modified للمورد الواحد فقط؛ القوائم تمرر None فلا تُرسل Last-Modified ولا يُقبل If-Modified-Since
+    (أحدث سطر في الصفحة ليس نسخة متزايدة للقائمة، وLast-Modified مقرّب إلى الثانية).
+
+    الصفحات التي تحمل رسائل flash لا تأخذ مدققات حتى لا يُعاد عرض رسالة قديمة من ذاكرة المتصفح.
+    """
+    if '_flashes' in session:
+        return render()
+    if is_not_modified(etag, last_modified):
+        response = app.response_class(status=304)
+    else:
+        response = app.make_response(render())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # العملة في الجلسة تغيّر الجسم، والعميل يعيد التحقق في كل مرة
+    response.vary.add('Cookie')
+    response.cache_control.no_cache = True
+    return response
+
+# ===== القياس: استعلامات SQL وزمن الطلبات (Prometheus) =====
+
+REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# عينات الزمن الحديثة لكل مسار (لحساب المئينات) وعدد أبطأ الاستعلامات المحفوظة
+METRICS_RECENT_SAMPLES = 1024
+METRICS_SLOWEST_STATEMENTS = 5
+
+
+class Histogram:
+    """هستوغرام تراكمي بحدود ثابتة (صيغة Prometheus: كل حد يشمل ما قبله)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class RequestMetrics:
+    """مقاييس لكل مسار داخل العملية: عدادات وهستوغرامات تراكمية، ونافذة متحركة للمئينات وأبطأ الاستعلامات.
+
+    كل عملية (عامل gunicorn) تحتفظ بمقاييسها؛ Prometheus يجمعها عند القراءة من كل عامل.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)  # (endpoint, method, status) -> count
+        self.durations = defaultdict(lambda: Histogram(REQUEST_DURATION_BUCKETS))
+        self.sql_time = defaultdict(lambda: Histogram(REQUEST_DURATION_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.recent = defaultdict(lambda: deque(maxlen=METRICS_RECENT_SAMPLES))  # endpoint -> (time, seconds)
+        self.slowest = defaultdict(list)  # endpoint -> [(seconds, time, statement)]
+
+    def observe(self, endpoint, method, status, duration, sql):
+        now = time.time()
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.durations[endpoint].observe(duration)
+            self.sql_time[endpoint].observe(sql['time'])
+            self.queries[endpoint].observe(sql['count'])
+            self.recent[endpoint].append((now, duration))
+            slowest = [entry for entry in self.slowest[endpoint] if entry[1] > now - self.window]
+            slowest.extend((seconds, now, statement) for seconds, statement in sql['slowest'])
+            slowest.sort(key=lambda entry: entry[0], reverse=True)
+            self.slowest[endpoint] = slowest[:METRICS_SLOWEST_STATEMENTS]
+
+    def render_prometheus(self):
+        """النص بصيغة Prometheus exposition (text/plain; version=0.0.4)."""
+        now = time.time()
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram(name, histograms):
+            for endpoint, hist in sorted(histograms.items()):
+                label = f'endpoint="{prometheus_escape(endpoint)}"'
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{{label}}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{{label}}} {hist.count}')
+
+        with self._lock:
+            metric('homy_http_requests_total', 'counter', 'Requests by endpoint, method and status.')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'homy_http_requests_total{{endpoint="{prometheus_escape(endpoint)}",'
+                             f'method="{method}",status="{status}"}} {count}')
+
+            metric('homy_http_request_duration_seconds', 'histogram', 'Request duration (until the response is built).')
+            histogram('homy_http_request_duration_seconds', self.durations)
+            metric('homy_db_queries_per_request', 'histogram', 'SQL statements executed per request.')
+            histogram('homy_db_queries_per_request', self.queries)
+            metric('homy_db_time_seconds', 'histogram', 'Total SQL time per request.')
+            histogram('homy_db_time_seconds', self.sql_time)
+
+            metric('homy_http_request_duration_recent_seconds', 'summary',
+                   f'Request duration quantiles over the last {self.window}s (up to {METRICS_RECENT_SAMPLES} samples).')
+            for endpoint, samples in sorted(self.recent.items()):
+                values = sorted(seconds for at, seconds in samples if at > now - self.window)
+                if not values:
+                    continue
+                label = f'endpoint="{prometheus_escape(endpoint)}"'
+                for quantile in (0.5, 0.9, 0.99):
+                    value = values[min(len(values) - 1, int(quantile * len(values)))]
+                    lines.append(f'homy_http_request_duration_recent_seconds{{{label},quantile="{quantile}"}} {value:.6f}')
+                lines.append(f'homy_http_request_duration_recent_seconds_sum{{{label}}} {sum(values):.6f}')
+                lines.append(f'homy_http_request_duration_recent_seconds_count{{{label}}} {len(values)}')
+
+            metric('homy_db_slowest_statement_seconds', 'gauge',
+                   f'Slowest SQL statements per endpoint over the last {self.window}s.')
+            for endpoint, slowest in sorted(self.slowest.items()):
+                for rank, (seconds, at, statement) in enumerate(slowest, 1):
+                    if at <= now - self.window:
+                        continue
+                    lines.append(f'homy_db_slowest_statement_seconds{{endpoint="{prometheus_escape(endpoint)}",'
+                                 f'rank="{rank}",statement="{prometheus_escape(statement)}"}} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+
+def prometheus_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def compact_sql(statement, limit=300):
+    """سطر واحد مختصر للعرض في السجل والمقاييس."""
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit - 3] + '...'
+
+
+request_metrics = RequestMetrics(app.config['METRICS_WINDOW_SECONDS'])
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timer(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    sql = g.get('sql_stats') if has_request_context() else None
+    if sql is None:
+        return
+    duration = time.perf_counter() - started
+    sql['count'] += 1
+    sql['time'] += duration
+    # نفس نص الاستعلام يتكرر في أنماط N+1؛ التجميع حسب النص يكشفها في سجل الطلبات البطيئة
+    group = sql['statements'].setdefault(statement, [0, 0.0])
+    group[0] += 1
+    group[1] += duration
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+        g.sql_stats = {'count': 0, 'time': 0.0, 'statements': {}}
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Server-Timing وتسجيل المقاييس؛ زمن الاستجابات المتدفقة يشمل البدء فقط لا الإرسال."""
+    sql = g.get('sql_stats')
+    if sql is None:
+        return response
+    duration = time.perf_counter() - g.request_started
+    groups = sorted(sql['statements'].items(), key=lambda item: item[1][1], reverse=True)
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.observe(endpoint, request.method, response.status_code, duration, {
+        'count': sql['count'],
+        'time': sql['time'],
+        'slowest': [(total / count, compact_sql(statement))
+                    for statement, (count, total) in groups[:METRICS_SLOWEST_STATEMENTS]]
+    })
+
+    if app.config['SERVER_TIMING']:
+        response.headers.add('Server-Timing', f'db;dur={sql["time"] * 1000:.2f};desc="{sql["count"]} queries"')
+        response.headers.add('Server-Timing', f'app;dur={(duration - sql["time"]) * 1000:.2f}')
+        response.headers.add('Server-Timing', f'total;dur={duration * 1000:.2f}')
+
+    if duration * 1000 >= app.config['SLOW_REQUEST_MS']:
+        breakdown = ''.join(f'\n  {count}× {total * 1000:.1f}ms {compact_sql(statement)}'
+                            for statement, (count, total) in groups[:10])
+        app.logger.warning('طلب بطيء: %s %s (%s) %.1fms، %s استعلام في %.1fms%s',
+                           request.method, request.full_path.rstrip('?'), endpoint, duration * 1000,
+                           sql['count'], sql['time'] * 1000, breakdown)
+    return response
+
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """المقاييس بصيغة Prometheus؛ لمشرف مسجل أو بـ Authorization: Bearer <METRICS_TOKEN>."""
+    token = app.config['METRICS_TOKEN']
+    if not (token and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')):
+        denied = admin_api_denied()
+        if denied:
+            return denied
+    return app.response_class(request_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+# ===== التوصيف عند الطلب (cProfile) =====
+
+# عدد الدوال الأثقل المحفوظة في ملخص كل ملف توصيف (المعروض في لوحة الإدارة)
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_FILE_KINDS = {'prof': 'application/octet-stream', 'collapsed': 'text/plain', 'json': 'application/json'}
+PROFILE_SKIP_ENDPOINTS = {'static', 'admin_api_profiles', 'admin_profile_file'}
+# المسارات الأقل من هذا الزمن (ثانية) لا تُتبع في المكدسات المطوية؛ بدونه يتضاعف عدد المسارات أسياً
+PROFILE_MIN_STACK_TIME = 0.00001
+# توصيف واحد في كل عملية: منذ Python 3.12 يعتمد cProfile على sys.monitoring العام لكل الخيوط،
+# فتشغيل ثانٍ يرفع ValueError. الطلب الذي لا يجد القفل حراً يُنفذ دون توصيف.
+profile_lock = threading.Lock()
+
+
+def profile_trigger():
+    """'admin' لطلب صريح من مشرف، أو 'sampled' لعينة عشوائية، أو None."""
+    if not app.config['PROFILING_ENABLED'] or request.endpoint in PROFILE_SKIP_ENDPOINTS:
+        return None
+    # الجلسة تُقرأ فقط عند طلب التوصيف حتى لا تُضاف Vary: Cookie لكل الاستجابات
+    if (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1') and 'admin_id' in session:
+        return 'admin'
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        return 'sampled'
+    return None
+
+
+def profile_frame_label(func):
+    """اسم الإطار في المكدس المطوي: الدالة (الملف:السطر)؛ دوال C بلا ملف."""
+    filename, lineno, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    if filename.startswith(app.root_path):
+        filename = os.path.relpath(filename, app.root_path)
+    else:
+        filename = os.path.join(*filename.split(os.sep)[-2:])
+    return f'{name} ({filename}:{lineno})'.replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """أسطر "إطار;إطار;... وزن" (ميكروثانية) لـ flamegraph.pl وspeedscope من إحصاءات cProfile.
+
+    cProfile يسجل أزواج المستدعي/المستدعى لا المكدسات الكاملة، فزمن كل دالة يُوزَّع على مساراتها
+    بنسبة زمن كل استدعاء: المكدسات تقريبية، والمسارات الأقصر من PROFILE_MIN_STACK_TIME تُهمل.
+    """
+    children = defaultdict(list)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            children[caller].append((func, edge[3]))
+
+    weights = defaultdict(float)
+
+    def walk(func, path, labels, share):
+        tt = stats.stats[func][2]
+        labels = labels + (profile_frame_label(func),)
+        if tt * share:
+            weights[';'.join(labels)] += tt * share
+        for callee, edge_time in children[func]:
+            callee_time = stats.stats[callee][3]
+            # الاستدعاء الذاتي يُطوى في الإطار الأعلى
+            if callee in path or not callee_time or edge_time * share < PROFILE_MIN_STACK_TIME:
+                continue
+            walk(callee, path | {callee}, labels, share * edge_time / callee_time)
+
+    for root in roots:
+        if stats.stats[root][3] >= PROFILE_MIN_STACK_TIME:
+            walk(root, {root}, (), 1.0)
+    return [(stack, round(seconds * 1e6)) for stack, seconds in sorted(weights.items()) if round(seconds * 1e6)]
+
+
+@app.before_request
+def start_profiling():
+    trigger = profile_trigger()
+    if not trigger or not profile_lock.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # أداة توصيف أخرى نشطة (مصحح أو coverage)
+        profile_lock.release()
+        return
+    g.profile = {'profiler': profiler, 'trigger': trigger, 'started': time.perf_counter()}
+
+
+def finish_profiling(status):
+    """إيقاف توصيف الطلب الحالي وحفظ <id>.prof و<id>.collapsed و<id>.json؛ يعيد المعرف أو None."""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return None
+    try:
+        profile['profiler'].disable()
+    finally:
+        profile_lock.release()
+    duration = time.perf_counter() - profile['started']
+    stats = pstats.Stats(profile['profiler'])
+
+    endpoint = request.endpoint or 'unmatched'
+    profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{re.sub(r'[^A-Za-z0-9_.]', '_', endpoint)}-{secrets.token_hex(3)}"
+    directory = app.config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile_id)
+    stats.dump_stats(base + '.prof')
+    with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+        f.writelines(f'{stack} {weight}\n' for stack, weight in collapsed_stacks(stats))
+
+    sql = g.get('sql_stats')
+    top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:PROFILE_TOP_FUNCTIONS]
+    summary = {
+        'id': profile_id,
+        'created_at': datetime.utcnow().isoformat(),
+        'trigger': profile['trigger'],
+        'endpoint': endpoint,
+        'method': request.method,
+        # المسار دون معاملات الاستعلام: العينات العشوائية قد تأتي من طلبات العملاء
+        'path': request.path,
+        'status': status,
+        'duration_ms': round(duration * 1000, 2),
+        'queries': sql['count'] if sql else None,
+        'sql_ms': round(sql['time'] * 1000, 2) if sql else None,
+        'top': [{'function': profile_frame_label(func), 'calls': nc, 'self_ms': round(tt * 1000, 3),
+                 'cumulative_ms': round(ct * 1000, 3)}
+                for func, (cc, nc, tt, ct, callers) in top]
+    }
+    # ملف الملخص يُكتب أخيراً: القائمة لا تعرض توصيفاً لم تكتمل ملفاته
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False)
+    prune_profiles(directory, app.config['PROFILE_KEEP'])
+    return profile_id
+
+
+def prune_profiles(directory, keep):
+    """حذف ملفات التوصيف الأقدم من آخر keep (المعرفات تبدأ بالوقت فترتيبها زمني)."""
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:max(len(ids) - keep, 0)]:
+        for kind in PROFILE_FILE_KINDS:
+            try:
+                os.remove(os.path.join(directory, f'{profile_id}.{kind}'))
+            except FileNotFoundError:
+                pass
+
+
+@app.after_request
+def save_request_profile(response):
+    profile_id = finish_profiling(response.status_code)
+    if profile_id:
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@app.teardown_request
+def discard_request_profile(exc):
+    # استثناء بعد بدء التوصيف لم يصل إلى after_request
+    if 'profile' in g:
+        finish_profiling(500)
+
+
+@app.route('/admin/api/profiles')
+def admin_api_profiles():
+    """آخر ملفات التوصيف (الأحدث أولاً) مع أثقل الدوال في كل منها."""
+    denied = admin_api_denied()
+    if denied:
+        return denied
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = max(1, min(request.args.get('per_page', ADMIN_PAGE_SIZE, type=int), ADMIN_MAX_PAGE_SIZE))
+    directory = app.config['PROFILE_DIR']
+    names = sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True) \
+        if os.path.isdir(directory) else []
+    items = []
+    for name in names[(page - 1) * per_page:page * per_page]:
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                items.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # حُذف أثناء القراءة
+    return jsonify({'items': items, 'page': {
+        'page': page,
+        'per_page': per_page,
+        'has_next': len(names) > page * per_page,
+        'has_prev': page > 1
+    }})
+
+
+@app.route('/admin/profiles/<profile_id>.<kind>')
+def admin_profile_file(profile_id, kind):
+    """تنزيل ملف توصيف: .prof (pstats/snakeviz) أو .collapsed (flamegraph.pl/speedscope) أو .json."""
+    denied = admin_api_denied()
+    if denied:
+        return denied
+    if kind not in PROFILE_FILE_KINDS:
+        return jsonify({'error': 'not_found'}), 404
+    return send_from_directory(app.config['PROFILE_DIR'], f'{profile_id}.{kind}',
+                               mimetype=PROFILE_FILE_KINDS[kind], as_attachment=True)
+
+
 # ===== مسارات المتجر العام =====
 
 @app.route('/')
+@cached_response('categories')
+@read_replica
 def home():
     categories = Category.query.all()
-    favorites_count = len(session.get('favorites', []))
+    sid = cart_session_id()
+    favorites_count = cart_store().favorites_count(sid) if sid else 0
     return render_template('index.html', categories=categories, favorites_count=favorites_count)
 
 
 @app.route('/product/<int:product_id>')
+@cached_response('product:{product_id}')
+@read_replica
 def product_detail(product_id):
     product = Product.query.get_or_404(product_id)
     reviews = Review.query.filter_by(product_id=product.id).order_by(Review.date_posted.desc()).all()
     rating_info = product.get_rating_info()
-    
-    return render_template('product_detail.html', product=product, reviews=reviews, rating_info=rating_info)
 
+    category_version = product.category.updated_at if product.category else None
+    review_versions = [(r.id, r.updated_at) for r in reviews]
+    etag = version_etag(product.id, product.updated_at, category_version, review_versions)
+    last_modified = latest_version(product.updated_at, category_version, *(v for _, v in review_versions))
 
-@app.route('/api/products')
-def get_products():
-    query = request.args.get('query')
-    category_id = request.args.get('category_id')
-    
-    products_query = Product.query
-    
-    if query:
+    return conditional_response(etag, last_modified, lambda: render_template(
+        'product_detail.html', product=product, reviews=reviews, rating_info=rating_info))
+
+
+PRODUCT_LISTING_SORTS = ('relevance', 'price', 'price_desc', 'name', 'id')
+# نوع قيمة الترتيب في المؤشر لكل ترتيب؛ المؤشر قادم من العميل فلا يُربط بالاستعلام قبل التحقق
+CURSOR_VALUE_TYPES = {'relevance': (int, float), 'price': (int, float), 'price_desc': (int, float),
+                      'name': (str,), 'id': (int,)}
+SQLITE_MAX_INT = 2 ** 63 - 1
+
+
+def valid_cursor_value(value, types):
+    """هل القيمة من الأنواع المطلوبة وقابلة للربط (ليست bool ولا عدداً خارج المدى أو غير منته)؟"""
+    if isinstance(value, bool) or not isinstance(value, types):
+        return False
+    if isinstance(value, int):
+        return abs(value) <= SQLITE_MAX_INT
+    if isinstance(value, float):
+        return math.isfinite(value)
+    return True
+
+
+def product_listing_query(fields, query=None, category_id=None, sort=None, position=None):
+    """استعلام قائمة المنتجات (Product، قيمة الترتيب) مرتباً ومفلتراً، دون حد الصفحة.
+
+    position هو (آخر قيمة ترتيب، آخر id) من مؤشر الصفحة السابقة؛ يعيد None إذا لم يطابق نوعها الترتيب.
+    """
+    match = build_match_query(query) if query else None
+    use_search_index = bool(match) and search_index_available()
+
+    # مفتاح الترتيب (مع id لكسر التعادل) يُستخدم أيضاً كمؤشر الصفحة التالية
+    if sort == 'relevance' and not use_search_index:
+        sort = None
+    if sort not in PRODUCT_LISTING_SORTS:
+        sort = 'relevance' if use_search_index else 'id'
+    descending = sort == 'price_desc'
+    sort_column = {
+        'relevance': product_search_table.c.rank,
+        'price': Product.price,
+        'price_desc': Product.price,
+        'name': Product.name,
+        'id': Product.id
+    }[sort]
+
+    products_query = db.session.query(Product, sort_column).options(*product_load_options(fields))
+
+    if use_search_index:
+        # البحث عبر فهرس FTS5 مرتباً حسب الصلة (bm25)
+        products_query = products_query.join(
+            product_search_table, product_search_table.c.rowid == Product.id
+        ).filter(
+            product_search_table.c[SEARCH_INDEX_TABLE].op('MATCH')(match)
+        )
+    elif query:
         products_query = products_query.filter(or_(
             Product.name.contains(query),
             Product.description.contains(query)
         ))
-    
-    if category_id and category_id.isdigit():
-        products_query = products_query.filter_by(category_id=int(category_id))
 
-    products = products_query.all()
-    result = []
-    for p in products:
-        d = p.to_dict()
+    if category_id:
+        products_query = products_query.filter(Product.category_id == category_id)
+
+    if position:
+        last_value, last_id = position
+        if not (valid_cursor_value(last_value, CURSOR_VALUE_TYPES[sort]) and valid_cursor_value(last_id, (int,))):
+            return None
+        if sort == 'id':
+            products_query = products_query.filter(Product.id > last_id)
+        else:
+            # مقارنة صفّية (price, id) > (?, ?) تُنفَّذ كبحث نطاق في الفهرس المركب، بعكس OR
+            key = tuple_(sort_column, Product.id)
+            after = tuple_(last_value, last_id)
+            products_query = products_query.filter(key < after if descending else key > after)
+
+    if sort == 'id':
+        return products_query.order_by(Product.id)
+    if descending:
+        # التنازلي يعكس id أيضاً ليُقرأ نفس الفهرس (price, id) بالعكس
+        return products_query.order_by(sort_column.desc(), Product.id.desc())
+    return products_query.order_by(sort_column, Product.id)
+
+
+@app.route('/api/products')
+@cached_response('catalog')
+@read_replica
+def get_products():
+    category_id = request.args.get('category_id')
+    cursor = request.args.get('cursor')
+
+    fields = parse_product_fields(request.args.get('fields'))
+    if fields is None:
+        return jsonify({'error': 'invalid_fields', 'allowed': list(PRODUCT_FIELD_COLUMNS)}), 400
+
+    limit = request.args.get('limit', type=int) or app.config['PRODUCTS_PAGE_SIZE']
+    limit = max(1, min(limit, app.config['PRODUCTS_MAX_PAGE_SIZE']))
+
+    position = None
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return jsonify({'error': 'invalid_cursor'}), 400
+
+    products_query = product_listing_query(
+        fields, request.args.get('query'),
+        int(category_id) if category_id and category_id.isdigit() else None,
+        request.args.get('sort'), position
+    )
+    if products_query is None:
+        return jsonify({'error': 'invalid_cursor'}), 400
+    rows = products_query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_value = rows[-1]
+        next_cursor = encode_cursor([last_value, last_product.id])
+
+    # الصفحة تُبطل عند تغيّر أي منتج فيها (تقييم، مخزون، تعديل)
+    add_cache_tags(*(f'product:{p.id}' for p, _ in rows))
+
+    versions = [(p.id, p.updated_at) for p, _ in rows]
+    if 'category_name' in fields:
+        versions += sorted({(p.category_id, p.category.updated_at) for p, _ in rows if p.category})
+    etag = version_etag(sorted(request.args.items(multi=True)), versions, next_cursor)
+
+    def render():
+        result = []
         # include both raw price and formatted price according to session currency
-        try:
-            d['price_raw'] = p.price
-            d['price'] = format_price(p.price)
-        except Exception:
-            d['price_raw'] = p.price
-            d['price'] = p.price
-        result.append(d)
-    return jsonify(result)
+        prices = format_prices([p.price for p, _ in rows]) if 'price' in fields else None
+        for index, (p, _) in enumerate(rows):
+            d = p.to_dict(fields)
+            if 'price_raw' in fields:
+                d['price_raw'] = p.price
+            if prices:
+                d['price'] = prices[index]
+            result.append(d)
+        return jsonify({'items': result, 'next_cursor': next_cursor})
+
+    # قائمة: ETag فقط؛ أحدث updated_at في الصفحة قد ينقص (حذف منتج) فلا يصلح لـ If-Modified-Since
+    return conditional_response(etag, None, render)
 
 
 @app.route('/api/product/<int:product_id>')
+@cached_response('product:{product_id}')
+@read_replica
 def get_product(product_id):
     product = Product.query.get_or_404(product_id)
-    d = product.to_dict()
-    try:
+    category_version = product.category.updated_at if product.category else None
+    etag = version_etag(product.id, product.updated_at, category_version)
+
+    def render():
+        d = product.to_dict()
         d['price'] = format_price(product.price)
         d['price_raw'] = product.price
-    except Exception:
-        d['price'] = product.price
-        d['price_raw'] = product.price
-    return jsonify(d)
+        return jsonify(d)
+
+    return conditional_response(etag, latest_version(product.updated_at, category_version), render)
 
 # ===== مسارات التقييمات =====
 
@@ -375,7 +2315,9 @@ def submit_review(product_id):
     )
     
     db.session.add(new_review)
+    Product.adjust_rating(product_id, rating, 1)
     db.session.commit()
+    invalidate_cache(f'product:{product_id}')
     flash('تم إرسال تقييمك بنجاح!', 'success')
     return redirect(url_for('product_detail', product_id=product_id))
 
@@ -388,8 +2330,10 @@ def delete_review(review_id):
         return redirect(url_for('admin_panel'))
         
     review = Review.query.get_or_404(review_id)
+    Product.adjust_rating(review.product_id, -review.rating, -1)
     db.session.delete(review)
     db.session.commit()
+    invalidate_cache(f'product:{review.product_id}')
     flash('تم حذف التقييم بنجاح.', 'success')
     return redirect(url_for('admin_panel'))
 
@@ -404,7 +2348,10 @@ def reset_product_reviews(product_id):
     product = Product.query.get_or_404(product_id)
     
     Review.query.filter_by(product_id=product_id).delete()
+    product.rating_sum = 0
+    product.rating_count = 0
     db.session.commit()
+    invalidate_cache(f'product:{product_id}')
     
     flash(f'تمت إعادة تعيين جميع تقييمات المنتج {product.name} بنجاح.', 'warning')
     return redirect(url_for('admin_panel'))
@@ -412,6 +2359,7 @@ def reset_product_reviews(product_id):
 # ===== مسارات المفضلة =====
 
 @app.route('/favorites')
+@read_replica
 def favorites_view():
     favorite_products = get_favorites_details()
     return render_template('favorites.html', products=favorite_products)
@@ -419,90 +2367,155 @@ def favorites_view():
 
 @app.route('/favorites/toggle/<int:product_id>')
 def toggle_favorite(product_id):
-    if 'favorites' not in session:
-        session['favorites'] = []
-    
-    favorites_list = [int(id) for id in session['favorites']]
-    
     product = Product.query.get(product_id)
     if not product:
         return jsonify({"message": "المنتج غير موجود"}), 404
 
-    if product_id in favorites_list:
-        session['favorites'].remove(product_id)
-        message = f"تم إزالة {product.name} من المفضلة."
-        is_added = False
-    else:
-        session['favorites'].append(product_id)
+    store = cart_store()
+    sid = cart_session_id(create=True)
+    is_added = store.toggle_favorite(sid, product_id)
+    if is_added:
         message = f"تم إضافة {product.name} إلى المفضلة."
-        is_added = True
-        
-    session.modified = True
+    else:
+        message = f"تم إزالة {product.name} من المفضلة."
     
     return jsonify({
         "message": message,
-        "count": len(session['favorites']),
+        "count": store.favorites_count(sid),
         "is_added": is_added
     })
 
 # ===== مسارات السلة =====
 
+# حد أسطر السلة المرسلة للتسعير: كل سطر يصبح معرفاً في IN (...)
+CART_QUOTE_MAX_LINES = 100
+
 @app.route('/cart/add/<int:product_id>')
 def add_to_cart(product_id):
     product = Product.query.get(product_id)
     if not product or product.stock <= 0:
         return jsonify({"message": "المنتج غير متوفر أو نفد مخزونه"}), 404
 
-    cart = session.get('cart', {})
-    product_id_str = str(product_id)
+    store = cart_store()
+    sid = cart_session_id(create=True)
     
-    current_quantity = cart.get(product_id_str, 0)
+    current_quantity = store.get_quantity(sid, product_id)
     if current_quantity >= product.stock:
         return jsonify({"message": f"لا يمكن إضافة المزيد، الحد الأقصى للمخزون هو {product.stock}"}), 400
         
-    cart[product_id_str] = current_quantity + 1
-    session['cart'] = cart
-    session.modified = True
-    return jsonify({"message": f"تمت إضافة {product.name} إلى السلة", "cart_count": sum(cart.values())})
+    store.add_to_cart(sid, product_id, 1)
+    return jsonify({"message": f"تمت إضافة {product.name} إلى السلة", "cart_count": store.cart_count(sid)})
 
 
 @app.route('/cart')
 def view_cart():
-    cart_items, total_price = get_cart_details()
+    cart = current_cart()
+    cart_items, total_price = get_cart_details(cart=cart)
     # أضف تمثيلات الأسعار المحوّلة/المنسقة لكل عنصر وإجمالي السلة
+    engine, currency = current_currency_engine(), get_current_currency()
     for it in cart_items:
-        try:
-            it['price_display'] = format_price(it.get('price', 0))
-            it['item_total_display'] = format_price(it.get('item_total', 0))
-        except Exception:
-            it['price_display'] = it.get('price', 0)
-            it['item_total_display'] = it.get('item_total', 0)
-
-    try:
-        total_display = format_price(total_price)
-    except Exception:
-        total_display = total_price
+        it['price_display'] = engine.format(it.get('price', 0), currency)
+        it['item_total_display'] = engine.format(it.get('item_total', 0), currency)
+    total_display = engine.format(total_price, currency)
 
     return jsonify({
         'items': cart_items,
         'total': total_price,
         'total_display': total_display,
-        'count': sum(session.get('cart', {}).values())
+        'count': sum(cart.values())
     })
 
 
+def reserve_stock(quantities):
+    """حجز المخزون لكل أسطر الطلب بأمر UPDATE شرطي واحد داخل المعاملة الحالية.
+
+    quantities: قاموس product_id -> الكمية المطلوبة.
+    يعيد قائمة فارغة عند النجاح. إذا نقص أي سطر يتم التراجع عن المعاملة كاملة
+    (لا يُخصم شيء) وتُعاد تفاصيل الأسطر الناقصة مع المتوفر حالياً.
+    """
+    if not quantities:
+        return []
+
+    requested = case(quantities, value=Product.id)
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(list(quantities)), Product.stock >= requested)
+        .values(stock=Product.stock - requested)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == len(quantities):
+        return []
+
+    db.session.rollback()
+    available = {
+        product_id: (name, stock)
+        for product_id, name, stock in db.session.query(Product.id, Product.name, Product.stock)
+        .filter(Product.id.in_(list(quantities)))
+    }
+    shortages = []
+    for product_id, quantity in quantities.items():
+        name, stock = available.get(product_id, (None, 0))
+        if stock < quantity:
+            shortages.append({
+                'product_id': product_id,
+                'name': name,
+                'requested': quantity,
+                'available': max(stock, 0)
+            })
+    return shortages
+
+
+@app.route('/api/cart/quote', methods=['GET', 'POST'])
+def cart_quote():
+    """تسعير السلة الحالية، أو سلة مرسلة كـ JSON: {"items": [{"product_id": 1, "quantity": 2}, ...]}."""
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or {}
+        lines = payload.get('items', []) if isinstance(payload, dict) else None
+        if not isinstance(lines, list):
+            return jsonify({'error': 'invalid_items'}), 400
+        if len(lines) > CART_QUOTE_MAX_LINES:
+            return jsonify({'error': 'too_many_items', 'max': CART_QUOTE_MAX_LINES}), 400
+        cart = {}
+        try:
+            for line in lines:
+                quantity = int(line['quantity'])
+                if quantity > 0:
+                    product_id = int(line['product_id'])
+                    cart[product_id] = cart.get(product_id, 0) + quantity
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'invalid_items'}), 400
+    else:
+        cart = current_cart()
+
+    return jsonify(quote_cart(cart, load_cart_products(cart)))
+
+
 @app.route('/cart/clear')
 def clear_cart():
-    session['cart'] = {}
-    session.modified = True
+    sid = cart_session_id()
+    if sid:
+        cart_store().clear_cart(sid)
     return jsonify({"message": "تم تفريغ السلة بنجاح", "cart_count": 0})
 
 
 @app.route('/checkout', methods=['GET', 'POST'])
 def checkout():
-    cart_items, total_price = get_cart_details()
+    key = idempotency_key('checkout') if request.method == 'POST' else None
+    replay = idempotent_replay(key)
+    if replay:
+        # إرسال مكرر لطلب تم بالفعل: نفس التوجيه دون تحميل السلة أو لمس المخزون
+        return replay
+
+    # تحميل منتجات السلة مرة واحدة وإعادة استخدامها في التسعير وتحديث المخزون
+    cart = current_cart()
+    cart_products = load_cart_products(cart)
+    cart_items, total_price = get_cart_details(cart_products, cart)
 
     if not cart_items:
+        # قد يكون الإرسال الأول قد أنهى الطلب وأفرغ السلة للتو
+        replay = idempotent_replay(key)
+        if replay:
+            return replay
         flash("السلة فارغة، يرجى إضافة منتجات أولاً.")
         return redirect(url_for('home'))
 
@@ -511,48 +2524,55 @@ def checkout():
         email = request.form.get('email')
         payment_method = request.form.get('payment_method', 'cod')
 
+        # معاملة واحدة: حجز المفتاح ثم المخزون ثم إنشاء الطلب وعناصره، ثم commit واحد
+        if key and not claim_idempotency_key(key):
+            return idempotent_replay(key) or redirect(url_for('checkout'), code=303)
+        shortages = reserve_stock({item['product_id']: item['quantity'] for item in cart_items})
+        if shortages:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({'message': 'المخزون غير كافٍ لبعض المنتجات', 'shortages': shortages}), 409
+            cart_items, total_price = get_cart_details()
+            return render_template('checkout.html', cart_items=cart_items, total_price=total_price,
+                                   shortages=shortages, idempotency_key=secrets.token_urlsafe(16)), 409
+
         new_order = Order(
             customer_name=name,
             customer_email=email,
-            total_price=total_price
+            total_price=total_price,
+            # online: بانتظار الدفع عبر المعالج، وإلا الدفع عند الاستلام
+            status='Pending Payment' if payment_method == 'online' else 'COD'
         )
         db.session.add(new_order)
-        db.session.commit()
-        
-        for item in cart_items:
-            product = Product.query.get(item['product_id'])
-            if product and product.stock >= item['quantity']:
-                product.stock -= item['quantity']
-            
-            order_item = OrderItem(
-                order_id=new_order.id,
-                product_name=item['name'],
-                price=item['price'],
-                quantity=item['quantity']
-            )
-            db.session.add(order_item)
-            
-        db.session.commit()
+        db.session.flush()
+
+        db.session.execute(insert(OrderItem), [{
+            'order_id': new_order.id,
+            'product_name': item['name'],
+            'price': item['price'],
+            'quantity': item['quantity'],
+            'product_id': item['product_id'],
+            'category_id': cart_products[item['product_id']].category_id
+        } for item in cart_items])
+        # المتابعة (البريد، تنبيهات المخزون) خارج مسار الطلب: تُضاف للطابور في نفس المعاملة
+        enqueue_job('order.confirmation', {'order_id': new_order.id},
+                    idempotency_key=f'order-confirmation:{new_order.id}')
+        enqueue_job('stock.low_check', {'product_ids': [item['product_id'] for item in cart_items]})
 
         # Handle post-order payment flow
         if payment_method == 'online':
-            # mark pending payment and redirect to simulated processor
-            new_order.status = 'Pending Payment'
-            db.session.commit()
-            # clear cart for now (items stored in order)
-            session['cart'] = {}
-            session.modified = True
-            return redirect(url_for('process_payment', order_id=new_order.id), code=303)
-
-        # Cash on Delivery
-        new_order.status = 'COD'
+            location = url_for('process_payment', order_id=new_order.id)
+        else:
+            location = url_for('order_success', order_id=new_order.id)
+        record_idempotent_result(key, new_order.id, location)
         db.session.commit()
+        invalidate_cache(*(f'product:{item["product_id"]}' for item in cart_items))
 
-        session['cart'] = {}
-        session.modified = True
-        return redirect(url_for('order_success', order_id=new_order.id), code=303)
+        # clear cart (items stored in order)
+        cart_store().clear_cart(cart_session_id())
+        return redirect(location, code=303)
 
-    return render_template('checkout.html', cart_items=cart_items, total_price=total_price)
+    return render_template('checkout.html', cart_items=cart_items, total_price=total_price,
+                           idempotency_key=secrets.token_urlsafe(16))
 
 
 @app.route('/order_success/<int:order_id>')
@@ -562,21 +2582,467 @@ def order_success(order_id):
 
 @app.route('/payment/process/<int:order_id>')
 def process_payment(order_id):
-    """محاكاة معالجة الدفع الإلكتروني.
-    هنا نقوم بعمل عملية وهمية: نضع حالة الطلب "Paid" ونحول المستخدم إلى صفحة النجاح.
+    """بدء الدفع الإلكتروني: التأكيد مع المعالج يتم في الطابور الخلفي (confirm_payment).
+
+    بدون Idempotency-Key يُستخدم رقم الطلب كمفتاح، فأي إعادة للطلب تُعاد توجيهها بقراءة واحدة.
     """
+    key = idempotency_key('payment', default=str(order_id))
+    replay = idempotent_replay(key)
+    if replay:
+        return replay
+
     order = Order.query.get_or_404(order_id)
-    # In real integration, here we'd call the payment gateway API and verify payment result.
-    order.status = 'Paid'
-    db.session.commit()
-    flash('تمت معالجة الدفع بنجاح.', 'success')
-    return redirect(url_for('payment_success', order_id=order_id), code=303)
+    location = url_for('payment_success', order_id=order_id)
+    if order.status == 'Pending Payment':
+        if not claim_idempotency_key(key):
+            return idempotent_replay(key) or redirect(location, code=303)
+        enqueue_job('payment.confirm', {'order_id': order_id}, idempotency_key=f'payment-confirm:{order_id}')
+        record_idempotent_result(key, order_id, location)
+        db.session.commit()
+    flash('تم استلام الدفع، وسيتم تأكيده خلال لحظات.', 'success')
+    return redirect(location, code=303)
 
 
 @app.route('/payment/success/<int:order_id>')
 def payment_success(order_id):
     return render_template('order_success.html', order_id=order_id)
 
+# ===== مفاتيح منع التكرار (Idempotency-Key) =====
+
+def idempotency_key(scope, default=None):
+    """المفتاح المخزن للطلب الحالي، أو None إذا لم يرسل العميل مفتاحاً.
+
+    مفتاح العميل يأتي من ترويسة Idempotency-Key أو الحقل idempotency_key، ويُقيد بالنطاق
+    وجلسة الزائر حتى لا يصل زائر إلى نتيجة طلب غيره بتخمين المفتاح.
+    """
+    client_key = request.headers.get('Idempotency-Key') or request.values.get('idempotency_key') or default
+    if not client_key:
+        return None
+    return hashlib.sha256(f'{scope}:{cart_session_id()}:{client_key}'.encode('utf-8')).hexdigest()
+
+
+def idempotent_replay(key):
+    """توجيه إلى نتيجة الطلب السابق بنفس المفتاح (قراءة واحدة بالمفتاح الأساسي)، أو None."""
+    if not key:
+        return None
+    location = db.session.execute(
+        select(IdempotencyRecord.location).where(
+            IdempotencyRecord.key == key,
+            IdempotencyRecord.created_at > datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_KEY_TTL'])
+        )
+    ).scalar()
+    return redirect(location, code=303) if location else None
+
+
+def claim_idempotency_key(key):
+    """حجز المفتاح كأول كتابة في المعاملة؛ الطلب المكرر المتزامن ينتظر هنا حتى تنتهي الأولى.
+
+    يعيد False (بعد التراجع عن المعاملة) إذا سبقه طلب بنفس المفتاح. المفتاح المنتهي يُستبدل.
+    """
+    stmt = dialect_insert(IdempotencyRecord).values(key=key, created_at=datetime.utcnow())
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['key'],
+        set_={'created_at': stmt.excluded.created_at, 'order_id': None, 'location': None},
+        where=IdempotencyRecord.created_at <= datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_KEY_TTL'])
+    )
+    if db.session.execute(stmt).rowcount == 1:
+        return True
+    db.session.rollback()
+    return False
+
+
+def record_idempotent_result(key, order_id, location):
+    """ربط المفتاح المحجوز بنتيجته ضمن نفس المعاملة (لا شيء بدون مفتاح)."""
+    if key:
+        db.session.execute(
+            update(IdempotencyRecord).where(IdempotencyRecord.key == key).values(order_id=order_id, location=location)
+        )
+
+
+@app.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """حذف مفاتيح منع التكرار المنتهية (أقدم من IDEMPOTENCY_KEY_TTL)."""
+    result = db.session.execute(IdempotencyRecord.__table__.delete().where(
+        IdempotencyRecord.created_at <= datetime.utcnow() - timedelta(seconds=app.config['IDEMPOTENCY_KEY_TTL'])
+    ))
+    db.session.commit()
+    print(f"تم حذف {result.rowcount} مفتاح.")
+
+
+# ===== طابور المهام الخلفية =====
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """تسجيل دالة كمنفذ لنوع مهمة؛ تستقبل الحمولة كوسائط مسماة.
+
+    التنفيذ "مرة على الأقل": المهمة قد تُعاد بعد خطأ أو توقف العامل، فيجب أن يكون المنفذ آمناً للتكرار.
+    تغييرات المنفذ في قاعدة البيانات تُحفظ في نفس المعاملة التي تعلّم المهمة منتهية.
+    """
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, payload=None, idempotency_key=None, delay=0, max_attempts=None):
+    """إضافة مهمة ضمن المعاملة الحالية؛ لا يراها العامل إلا بعد commit المعاملة نفسها.
+
+    وجود مهمة سابقة بنفس idempotency_key يعني أن العمل مجدول بالفعل: يعيد False ولا يضيف شيئاً.
+    """
+    stmt = dialect_insert(Job).values(
+        kind=kind,
+        payload=payload or {},
+        idempotency_key=idempotency_key,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts or app.config['JOB_MAX_ATTEMPTS']
+    )
+    result = db.session.execute(stmt.on_conflict_do_nothing(index_elements=['idempotency_key']))
+    return result.rowcount == 1
+
+
+def job_retry_delay(attempts):
+    """تأخير أسي مع عشوائية (jitter) حتى لا تعود المهام الفاشلة معاً في نفس اللحظة."""
+    delay = min(app.config['JOB_RETRY_MAX_DELAY'], app.config['JOB_RETRY_BASE_DELAY'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_job(worker_id):
+    """حجز أقدم مهمة مستحقة؛ التحديث الشرطي يمنع عاملين من حجز نفس المهمة.
+
+    المهام العالقة في running أكثر من JOB_LOCK_TIMEOUT (عامل توقف فجأة) تُستعاد كأنها مستحقة.
+    """
+    now = datetime.utcnow()
+    claimable = or_(
+        and_(Job.status == 'queued', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at < now - timedelta(seconds=app.config['JOB_LOCK_TIMEOUT']))
+    )
+    candidates = db.session.scalars(select(Job.id).where(claimable).order_by(Job.run_at, Job.id).limit(5)).all()
+    for job_id in candidates:
+        result = db.session.execute(
+            update(Job).where(Job.id == job_id, claimable)
+            .values(status='running', locked_by=worker_id, locked_at=now, attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if result.rowcount:
+            return db.session.get(Job, job_id)
+    return None
+
+
+def run_job(job):
+    """تنفيذ مهمة محجوزة؛ عند الفشل تُجدول للإعادة أو تُعلّم failed بعد آخر محاولة."""
+    job_id, kind, payload = job.id, job.kind, job.payload or {}
+    try:
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            raise LookupError(f'لا يوجد منفذ لنوع المهمة {kind}')
+        handler(**payload)
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return True
+    except Exception as exc:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.last_error = f'{exc.__class__.__name__}: {exc}'[:2000]
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=job_retry_delay(job.attempts))
+        db.session.commit()
+        app.logger.warning('فشلت المهمة #%s (%s) في المحاولة %s/%s: %s',
+                           job_id, kind, job.attempts, job.max_attempts, job.last_error)
+        return False
+
+
+def work_jobs(worker_id, poll_interval, once=False, stop=None):
+    """حلقة العامل: تنفيذ المهام المستحقة واحدة تلو الأخرى، والانتظار عند فراغ الطابور.
+
+    once: الخروج عند فراغ الطابور. stop: threading.Event لإيقاف الحلقة بعد المهمة الحالية.
+    """
+    stop = stop or threading.Event()
+    processed = 0
+    while not stop.is_set():
+        job = claim_job(worker_id)
+        if job is None:
+            db.session.remove()
+            if once:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    db.session.remove()
+    return processed
+
+
+def start_worker_thread():
+    """عامل داخل العملية لخادم التطوير (python app.py) بدل تشغيل flask worker منفصلاً."""
+    def run():
+        with app.app_context():
+            work_jobs(f'{socket.gethostname()}:{os.getpid()}:thread', app.config['JOB_POLL_INTERVAL'])
+    threading.Thread(target=run, name='job-worker', daemon=True).start()
+
+
+@job_handler('payment.confirm')
+def confirm_payment(order_id):
+    """تأكيد الدفع لدى المعالج ثم تحويل الطلب إلى Paid (مرة واحدة فقط حتى لو أُعيدت المهمة)."""
+    # In real integration, call the payment gateway API here; raising on a transient error retries the job.
+    db.session.execute(
+        update(Order).where(Order.id == order_id, Order.status == 'Pending Payment').values(status='Paid')
+    )
+
+
+@job_handler('order.confirmation')
+def send_order_confirmation(order_id):
+    """رسالة تأكيد الطلب للعميل (لا يوجد خادم بريد مهيأ بعد، فتُسجل في السجل)."""
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return
+    app.logger.info('تأكيد الطلب #%s إلى %s: الإجمالي %s', order.id, order.customer_email, order.total_price)
+
+
+@job_handler('stock.low_check')
+def check_low_stock(product_ids):
+    """تنبيه عند نزول مخزون منتجات طلب ما إلى LOW_STOCK_THRESHOLD أو أقل."""
+    low = db.session.execute(
+        select(Product.id, Product.name, Product.stock)
+        .where(Product.id.in_(product_ids), Product.stock <= LOW_STOCK_THRESHOLD)
+    ).all()
+    for product_id, name, stock in low:
+        app.logger.warning('مخزون منخفض: المنتج #%s (%s) متبقٍ %s', product_id, name, stock)
+
+
+@app.route('/admin/jobs')
+def admin_jobs():
+    """حالة الطابور: الأعداد لكل حالة ونوع، وعمر أقدم مهمة منتظرة، وآخر المهام الفاشلة."""
+    denied = admin_api_denied('orders')
+    if denied:
+        return denied
+
+    counts = defaultdict(dict)
+    for kind, status, count in db.session.query(Job.kind, Job.status, func.count(Job.id)).group_by(Job.kind, Job.status):
+        counts[kind][status] = count
+    oldest = db.session.query(func.min(Job.run_at)).filter(
+        Job.status == 'queued', Job.run_at <= datetime.utcnow()
+    ).scalar()
+    failed = Job.query.filter(Job.status == 'failed').order_by(Job.finished_at.desc()).limit(20).all()
+
+    return jsonify({
+        'counts': counts,
+        'lag_seconds': round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0,
+        'failed': [{'id': job.id, 'kind': job.kind, 'payload': job.payload, 'attempts': job.attempts,
+                    'error': job.last_error, 'finished_at': job.finished_at.isoformat()} for job in failed]
+    })
+
+
+@app.route('/admin/jobs/<int:job_id>/retry', methods=['POST'])
+def admin_retry_job(job_id):
+    """إعادة مهمة فاشلة إلى الطابور بعدد محاولات جديد."""
+    denied = admin_api_denied('orders')
+    if denied:
+        return denied
+    result = db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'failed')
+        .values(status='queued', attempts=0, run_at=datetime.utcnow(), finished_at=None)
+    )
+    db.session.commit()
+    if not result.rowcount:
+        return jsonify({'error': 'not_found'}), 404
+    return jsonify({'id': job_id, 'status': 'queued'})
+
+
+@app.cli.command('worker')
+@click.option('--poll', type=float, default=None, help='ثوانٍ بين فحوص الطابور الفارغ (JOB_POLL_INTERVAL).')
+@click.option('--once', is_flag=True, help='تنفيذ المهام المستحقة ثم الخروج.')
+def worker_command(poll, once):
+    """تشغيل عامل الطابور الخلفي؛ SIGTERM/SIGINT ينهيه بعد المهمة الحالية."""
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *_: stop.set())
+    print(f"العامل {worker_id} يعمل...")
+    processed = work_jobs(worker_id, poll or app.config['JOB_POLL_INTERVAL'], once, stop)
+    print(f"تم تنفيذ {processed} مهمة.")
+
+
+@app.cli.command('purge-jobs')
+@click.option('--days', default=7, show_default=True, help='حذف المهام المنتهية الأقدم من هذا العدد من الأيام.')
+def purge_jobs_command(days):
+    """حذف المهام المنتهية (done) القديمة؛ الفاشلة تبقى للمراجعة."""
+    result = db.session.execute(
+        Job.__table__.delete().where(Job.status == 'done', Job.finished_at < datetime.utcnow() - timedelta(days=days))
+    )
+    db.session.commit()
+    print(f"تم حذف {result.rowcount} مهمة.")
+
+# ===== تصدير CSV متدفق =====
+
+EXPORT_CHUNK_ROWS = 1000
+
+
+def csv_stream(header, rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """توليد CSV على دفعات صغيرة بدل بناء الملف كاملاً في الذاكرة."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def jsonl_stream(rows, chunk_rows=EXPORT_CHUNK_ROWS):
+    """توليد JSON Lines (قاموس لكل سطر) على دفعات كما في csv_stream."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) >= chunk_rows:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def csv_download(filename, header, rows):
+    return streaming_download(filename, csv_stream(header, rows), 'text/csv')
+
+
+def streaming_download(filename, chunks, mimetype):
+    """استجابة تنزيل متدفقة، مضغوطة بـ gzip إذا قبلها العميل."""
+    gzip_accepted = 'gzip' in request.accept_encodings
+    if gzip_accepted:
+        chunks = gzip_stream(chunks)
+    resp = app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    resp.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    resp.vary.add('Accept-Encoding')
+    if gzip_accepted:
+        resp.headers['Content-Encoding'] = 'gzip'
+    return resp
+
+# ===== سجل نشاط المشرفين =====
+
+ACTIVITY_PAGE_SIZE = 20
+# العدد الكلي تقريبي: يُحسب مرة لكل مجموعة فلاتر ويُعاد استخدامه لمدة دقيقة
+activity_count_cache = ResponseCache(max_entries=256, ttl=60)
+
+
+def activity_filters(args):
+    """قراءة فلاتر السجل من معاملات الطلب؛ القيم غير الصالحة تُتجاهل."""
+    raw = {name: args.get(name) or '' for name in ('admin_id', 'action', 'date_from', 'date_to')}
+    filters = {'raw': raw, 'admin_id': None, 'action': raw['action'], 'date_from': None, 'date_to': None}
+    if raw['admin_id'].isdigit():
+        filters['admin_id'] = int(raw['admin_id'])
+    for name in ('date_from', 'date_to'):
+        try:
+            filters[name] = datetime.fromisoformat(raw[name]) if raw[name] else None
+        except ValueError:
+            pass
+    return filters
+
+
+def activity_query(filters):
+    """صفوف (id, timestamp, admin_id, action, username) مع اسم المشرف عبر JOIN واحد."""
+    q = db.session.query(
+        AdminActivity.id, AdminActivity.timestamp, AdminActivity.admin_id, AdminActivity.action, AdminUser.username
+    ).outerjoin(AdminUser, AdminUser.id == AdminActivity.admin_id)
+    if filters['admin_id'] is not None:
+        q = q.filter(AdminActivity.admin_id == filters['admin_id'])
+    if filters['action']:
+        q = q.filter(AdminActivity.action.ilike(f"%{filters['action']}%"))
+    if filters['date_from']:
+        q = q.filter(AdminActivity.timestamp >= filters['date_from'])
+    if filters['date_to']:
+        q = q.filter(AdminActivity.timestamp <= filters['date_to'])
+    return q
+
+
+def activity_count(filters):
+    key = tuple(sorted(filters['raw'].items()))
+    total = activity_count_cache.get(key, 'activity_count')
+    if total is None:
+        total = activity_query(filters).with_entities(func.count(AdminActivity.id)).scalar()
+        activity_count_cache.set(key, total, ())
+    return total
+
+
+def activity_page_query(filters, position=None, backwards=False):
+    """السجل مرتباً حسب (timestamp, id) تنازلياً، أو تصاعدياً بعد position عند الرجوع للصفحة الأحدث."""
+    q = activity_query(filters)
+    if position:
+        ts, activity_id = position
+        if backwards:
+            q = q.filter(or_(AdminActivity.timestamp > ts, and_(AdminActivity.timestamp == ts, AdminActivity.id > activity_id)))
+        else:
+            q = q.filter(or_(AdminActivity.timestamp < ts, and_(AdminActivity.timestamp == ts, AdminActivity.id < activity_id)))
+    if backwards:
+        return q.order_by(AdminActivity.timestamp.asc(), AdminActivity.id.asc())
+    return q.order_by(AdminActivity.timestamp.desc(), AdminActivity.id.desc())
+
+
+def activity_page(filters, after=None, before=None, per_page=ACTIVITY_PAGE_SIZE):
+    """صفحة من السجل (الأحدث أولاً) بمؤشر keyset على (timestamp, id) بدل OFFSET.
+
+    after: مؤشر آخر صف في الصفحة الحالية (للصفحة الأقدم)، before: مؤشر أول صف (للصفحة الأحدث).
+    """
+    cursor = decode_cursor(before or after or '')
+    position = None
+    if cursor:
+        try:
+            position = (datetime.fromisoformat(cursor[0]), int(cursor[1]))
+        except (TypeError, ValueError):
+            position = None
+
+    backwards = bool(before) and position is not None
+    rows = activity_page_query(filters, position, backwards).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    activities = [{
+        'timestamp': timestamp,
+        'admin_name': username or f'ID {admin_id}',
+        'action': action
+    } for _, timestamp, admin_id, action, username in rows]
+
+    def cursor_of(row):
+        return encode_cursor([row.timestamp.isoformat(), row.id])
+
+    pagination = {
+        'has_next': bool(rows) and (has_more if not backwards else True),
+        'has_prev': bool(rows) and (has_more if backwards else position is not None),
+        'next_cursor': cursor_of(rows[-1]) if rows else None,
+        'prev_cursor': cursor_of(rows[0]) if rows else None
+    }
+    return activities, pagination
+
+
+def render_manage_admins():
+    """صفحة المشرفين مع سجل النشاط المفلتر (مشتركة بين manage_admins و add_admin)."""
+    admins = AdminUser.query.order_by(AdminUser.username).all()
+    filters = activity_filters(request.args)
+    activities, pagination = activity_page(filters, request.args.get('after'), request.args.get('before'))
+    pagination['total'] = activity_count(filters)
+    return render_template('manage_admins.html', admins=admins, activities=activities,
+                           filters=filters['raw'], pagination=pagination)
+
 # ===== مسارات الإدارة والمصادقة =====
 
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -614,62 +3080,460 @@ def admin_logout():
 
 
 @app.route('/admin')
+@read_replica
 def admin_panel():
     if 'admin_id' not in session:
         return redirect(url_for('admin_login'))
         
     current_permissions = session.get('permissions', {})
+
+    # الصفحة الأولى تحتاج الإحصائيات فقط؛ الجداول تُجلب عند فتح كل قسم عبر /admin/api/*
+    product_counts = dict(
+        db.session.query(Product.category_id, func.count(Product.id)).group_by(Product.category_id).all()
+    )
+    categories = Category.query.order_by(Category.name).all()
     
-    products = Product.query.all()
-    orders = Order.query.order_by(Order.date_placed.desc()).all()
-    categories = Category.query.all()
-    all_reviews = Review.query.order_by(Review.date_posted.desc()).all()
-    
-    total_sales_result = db.session.query(func.sum(Order.total_price)).filter_by(status='Delivered').scalar()
-    total_sales = round(total_sales_result or 0, 2)
+    total_sales = total_delivered_sales()
     new_orders_count = Order.query.filter_by(status='New').count()
-    low_stock_products = Product.query.filter(Product.stock <= LOW_STOCK_THRESHOLD).all()
-
-    sales_labels = []
-    sales_data = []
-    for i in range(11, -1, -1):
-        month_date = datetime.now()
-        for _ in range(i):
-            if month_date.month == 1:
-                month_date = month_date.replace(year=month_date.year - 1, month=12)
-            else:
-                month_date = month_date.replace(month=month_date.month - 1)
-        month_str = month_date.strftime('%Y-%m')
-        sales_labels.append(month_str)
-        month_sales = db.session.query(func.sum(Order.total_price)).filter(
-            func.strftime('%Y-%m', Order.date_placed) == month_str,
-            Order.status == 'Delivered'
-        ).scalar() or 0
-        sales_data.append(round(month_sales, 2))
+    low_stock_count = Product.query.filter(Product.stock <= LOW_STOCK_THRESHOLD).count()
+
+    sales_from = parse_date_arg(request.args.get('sales_from'))
+    sales_to = parse_date_arg(request.args.get('sales_to'))
+    sales_category = request.args.get('sales_category', type=int)
+    sales_labels, sales_data = sales_report(sales_from, sales_to, sales_category)
     
     stats = {
         'total_sales': total_sales,
         'new_orders_count': new_orders_count,
-        'low_stock_count': len(low_stock_products),
+        'low_stock_count': low_stock_count,
         'sales_labels': sales_labels,
-        'sales_data': sales_data
+        'sales_data': sales_data,
+        'sales_by_category': sales_by_category(sales_from, sales_to)
     }
     
-    admin_users = AdminUser.query.all()
+    admin_users = AdminUser.query.all() if current_permissions.get('admins') else []
 
     return render_template(
         'admin.html',
-        products=products,
-        orders=orders,
         categories=categories,
-        all_reviews=all_reviews,
+        product_counts=product_counts,
         stats=stats,
-        low_stock_products=low_stock_products,
         admin_users=admin_users,
-        permissions=current_permissions
+        permissions=current_permissions,
+        low_stock_threshold=LOW_STOCK_THRESHOLD
     )
 
 
+def admin_api_denied(permission=None):
+    """يعيد رد خطأ JSON إذا لم يكن المشرف مسجلاً أو لا يملك الصلاحية."""
+    if 'admin_id' not in session:
+        return jsonify({'error': 'unauthenticated'}), 401
+    if permission and session.get('permissions', {}).get(permission) != True:
+        return jsonify({'error': 'forbidden'}), 403
+    return None
+
+
+def admin_page_query(q, sort_columns, default_sort, tiebreaker, args):
+    """الاستعلام مرتباً ومقسماً حسب page/per_page/sort في args (مع سطر إضافي لـ has_next)، وبيانات الصفحة.
+
+    sort هو اسم حقل من sort_columns مع '-' اختيارية للترتيب التنازلي.
+    """
+    page = max(args.get('page', 1, type=int), 1)
+    per_page = args.get('per_page', ADMIN_PAGE_SIZE, type=int)
+    per_page = max(1, min(per_page, ADMIN_MAX_PAGE_SIZE))
+
+    sort = args.get('sort') or default_sort
+    if sort.lstrip('-') not in sort_columns:
+        sort = default_sort
+    column = sort_columns[sort.lstrip('-')]
+    descending = sort.startswith('-')
+    q = q.order_by(column.desc() if descending else column.asc(),
+                   tiebreaker.desc() if descending else tiebreaker.asc())
+    return q.offset((page - 1) * per_page).limit(per_page + 1), {'page': page, 'per_page': per_page, 'sort': sort}
+
+
+def paginate_admin_query(q, sort_columns, default_sort, tiebreaker):
+    """ترتيب وتقسيم استعلام لقسم إداري حسب معاملات الطلب.
+
+    لا يُحسب العدد الكلي؛ has_next يُستنتج بجلب سطر إضافي.
+    """
+    q, page = admin_page_query(q, sort_columns, default_sort, tiebreaker, request.args)
+    rows = q.all()
+    page['has_next'] = len(rows) > page['per_page']
+    page['has_prev'] = page['page'] > 1
+    return rows[:page['per_page']], page
+
+
+# (حقول الترتيب، الترتيب الافتراضي، كاسر التعادل) لكل قسم إداري
+ADMIN_PRODUCT_SORTING = ({'id': Product.id, 'name': Product.name, 'price': Product.price, 'stock': Product.stock},
+                         '-id', Product.id)
+ADMIN_ORDER_SORTING = ({'id': Order.id, 'date': Order.date_placed, 'total': Order.total_price}, '-date', Order.id)
+ADMIN_REVIEW_SORTING = ({'id': Review.id, 'date': Review.date_posted, 'rating': Review.rating}, '-date', Review.id)
+LOW_STOCK_SORTING = ({'stock': Product.stock, 'name': Product.name}, 'stock', Product.id)
+
+
+def admin_products_query(args):
+    q = Product.query.options(
+        joinedload(Product.category),
+        load_only(Product.id, Product.name, Product.price, Product.stock, Product.image_url,
+                  Product.category_id, Product.rating_sum, Product.rating_count)
+    )
+    search = args.get('q')
+    if search:
+        q = q.filter(Product.name.contains(search))
+    category_id = args.get('category_id', type=int)
+    if category_id:
+        q = q.filter(Product.category_id == category_id)
+    return q
+
+
+def admin_orders_query(args):
+    q = Order.query
+    status = args.get('status')
+    if status:
+        q = q.filter(Order.status == status)
+    search = args.get('q')
+    if search:
+        q = q.filter(or_(Order.customer_name.contains(search), Order.customer_email.contains(search)))
+    return q
+
+
+def admin_reviews_query(args):
+    q = Review.query.options(joinedload(Review.product).load_only(Product.id, Product.name))
+    product_id = args.get('product_id', type=int)
+    if product_id:
+        q = q.filter(Review.product_id == product_id)
+    rating = args.get('rating', type=int)
+    if rating:
+        q = q.filter(Review.rating == rating)
+    return q
+
+
+def low_stock_query():
+    return Product.query.options(load_only(Product.id, Product.name, Product.stock)).filter(
+        Product.stock <= LOW_STOCK_THRESHOLD
+    )
+
+
+@app.route('/admin/api/products')
+def admin_api_products():
+    denied = admin_api_denied('products')
+    if denied:
+        return denied
+
+    products, page = paginate_admin_query(admin_products_query(request.args), *ADMIN_PRODUCT_SORTING)
+    items = []
+    for p, price_display in zip(products, format_prices([p.price for p in products])):
+        d = p.to_dict(['id', 'name', 'price', 'stock', 'image_url', 'category_name', 'rating'])
+        d['price_display'] = price_display
+        items.append(d)
+    return jsonify({'items': items, 'page': page})
+
+
+@app.route('/admin/api/orders')
+def admin_api_orders():
+    denied = admin_api_denied('orders')
+    if denied:
+        return denied
+
+    orders, page = paginate_admin_query(admin_orders_query(request.args), *ADMIN_ORDER_SORTING)
+    items = [{
+        'id': o.id,
+        'customer_name': o.customer_name,
+        'total_price': o.total_price,
+        'total_display': total_display,
+        'date_placed': o.date_placed.strftime('%Y-%m-%d %H:%M'),
+        'status': o.status
+    } for o, total_display in zip(orders, format_prices([o.total_price for o in orders]))]
+    return jsonify({'items': items, 'page': page})
+
+
+@app.route('/admin/api/reviews')
+def admin_api_reviews():
+    denied = admin_api_denied('reviews')
+    if denied:
+        return denied
+
+    reviews, page = paginate_admin_query(admin_reviews_query(request.args), *ADMIN_REVIEW_SORTING)
+    items = []
+    for r in reviews:
+        d = r.to_dict()
+        d['product_id'] = r.product_id
+        d['product_name'] = r.product.name if r.product else f'#{r.product_id}'
+        items.append(d)
+    return jsonify({'items': items, 'page': page})
+
+
+@app.route('/admin/api/low_stock')
+def admin_api_low_stock():
+    denied = admin_api_denied()
+    if denied:
+        return denied
+
+    products, page = paginate_admin_query(low_stock_query(), *LOW_STOCK_SORTING)
+    items = [{'id': p.id, 'name': p.name, 'stock': p.stock} for p in products]
+    return jsonify({'items': items, 'page': page})
+
+
+# ===== استيراد وتصدير المنتجات =====
+
+IMPORT_BATCH_ROWS = 1000
+# تفاصيل الأخطاء المعادة في التقرير؛ عددها الكلي يُحسب دائماً
+IMPORT_MAX_ERRORS = 1000
+PRODUCT_EXPORT_COLUMNS = ['sku', 'name', 'price', 'stock', 'category', 'description', 'image_url']
+
+
+def detect_import_format(filename, requested=None):
+    """csv أو jsonl حسب الطلب الصريح أو امتداد الملف؛ None إذا كان غير مدعوم."""
+    fmt = (requested or '').lower()
+    if not fmt:
+        fmt = 'jsonl' if (filename or '').lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    return fmt if fmt in ('csv', 'jsonl') else None
+
+
+def iter_import_records(stream, fmt):
+    """قراءة المدخل سطراً بسطر دون تحميله كاملاً: (رقم السطر، القاموس، رسالة الخطأ)."""
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text_stream)
+            for record in reader:
+                yield reader.line_num, record, None
+        else:
+            for line_no, line in enumerate(text_stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield line_no, None, 'JSON غير صالح'
+                    continue
+                if not isinstance(record, dict):
+                    yield line_no, None, 'يجب أن يكون السطر كائن JSON'
+                    continue
+                yield line_no, record, None
+    except (csv.Error, UnicodeDecodeError) as exc:
+        # خطأ في بنية الملف نفسه: لا يمكن متابعة القراءة بعده
+        yield None, None, f'تعذر قراءة الملف: {exc}'
+    finally:
+        text_stream.detach()
+
+
+def validate_import_record(record, category_ids):
+    """تحويل سطر خام إلى قيم أعمدة المنتج؛ يعيد (القيم، None) أو (None، رسالة الخطأ).
+
+    الحقول الاختيارية الفارغة تبقى None: عند التحديث تحتفظ بقيمتها الحالية.
+    """
+    def field(name):
+        value = record.get(name)
+        value = '' if value is None else str(value).strip()
+        return value or None
+
+    sku, name, category = field('sku'), field('name'), field('category')
+    if not sku or len(sku) > 64:
+        return None, 'sku مطلوب (64 حرفاً على الأكثر)'
+    if not name or len(name) > 100:
+        return None, 'name مطلوب (100 حرف على الأكثر)'
+    try:
+        price = float(field('price'))
+    except (TypeError, ValueError):
+        return None, 'price يجب أن يكون رقماً'
+    if not 0 <= price < float('inf'):
+        return None, 'price يجب أن يكون رقماً موجباً'
+    stock = field('stock')
+    if stock is not None:
+        try:
+            stock = int(stock)
+        except ValueError:
+            return None, 'stock يجب أن يكون عدداً صحيحاً'
+        if stock < 0:
+            return None, 'stock لا يمكن أن يكون سالباً'
+    if category not in category_ids:
+        return None, f'الفئة غير موجودة: {category or ""}'
+    image_url = field('image_url')
+    if image_url and len(image_url) > 200:
+        return None, 'image_url أطول من 200 حرف'
+
+    return {
+        'sku': sku,
+        'name': name,
+        'price': price,
+        'stock': stock,
+        'category_id': category_ids[category],
+        'description': field('description'),
+        'image_url': image_url
+    }, None
+
+
+def upsert_product_batch(rows):
+    """إدراج أو تحديث دفعة منتجات حسب sku بأمر executemany واحد؛ يعيد (المعرفات، عدد الجديد)."""
+    merged = {}
+    for row in rows:
+        # تكرار sku داخل الدفعة: الحقول غير الفارغة في السطر اللاحق تغلب
+        previous = merged.get(row['sku'], {})
+        merged[row['sku']] = dict(previous, **{key: value for key, value in row.items()
+                                               if value is not None or key not in previous})
+    rows = list(merged.values())
+    skus = [row['sku'] for row in rows]
+    existing = set(db.session.scalars(select(Product.sku).where(Product.sku.in_(skus))))
+    now = datetime.utcnow()
+    params = []
+    for row in rows:
+        if row['sku'] not in existing:
+            row = dict(row, stock=row['stock'] or 0, image_url=row['image_url'] or '/static/placeholder.png')
+        params.append(dict(row, updated_at=now))
+
+    stmt = dialect_insert(Product)
+    image_url = func.coalesce(stmt.excluded.image_url, Product.image_url)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.sku],
+        set_={
+            'name': stmt.excluded.name,
+            'price': stmt.excluded.price,
+            'category_id': stmt.excluded.category_id,
+            'stock': func.coalesce(stmt.excluded.stock, Product.stock),
+            'description': func.coalesce(stmt.excluded.description, Product.description),
+            'image_url': image_url,
+            # النسخ المصغرة تخص الصورة القديمة فقط
+            'image_variants': case((image_url == Product.image_url, Product.image_variants), else_=null()),
+            'updated_at': stmt.excluded.updated_at
+        }
+    )
+    db.session.execute(stmt, params)
+
+    product_ids = list(db.session.scalars(select(Product.id).where(Product.sku.in_(skus))))
+    reindex_products(product_ids)
+    return product_ids, len(rows) - len(existing)
+
+
+def import_products(stream, fmt, batch_rows=IMPORT_BATCH_ROWS):
+    """استيراد منتجات من CSV أو JSON Lines؛ كل دفعة من batch_rows سطر في معاملة مستقلة.
+
+    الأسطر غير الصالحة لا توقف الاستيراد بل تُجمع في التقرير مع رقم السطر.
+    أسماء الفئات تُحل من استعلام واحد في البداية.
+    """
+    category_ids = dict(db.session.query(Category.name, Category.id).all())
+    report = {'processed': 0, 'inserted': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+    batch = []
+
+    def add_error(line, sku, message):
+        report['error_count'] += 1
+        if len(report['errors']) < IMPORT_MAX_ERRORS:
+            report['errors'].append({'line': line, 'sku': sku, 'error': message})
+
+    def flush():
+        try:
+            product_ids, inserted = upsert_product_batch([values for _, values in batch])
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            app.logger.exception('فشل حفظ دفعة استيراد المنتجات')
+            for line, values in batch:
+                add_error(line, values['sku'], f'تعذر حفظ الدفعة: {exc.__class__.__name__}')
+        else:
+            invalidate_cache('catalog', *(f'product:{product_id}' for product_id in product_ids))
+            report['inserted'] += inserted
+            report['updated'] += len(product_ids) - inserted
+        batch.clear()
+
+    for line, record, error in iter_import_records(stream, fmt):
+        if line is not None:
+            report['processed'] += 1
+        if record is not None:
+            values, error = validate_import_record(record, category_ids)
+        if error:
+            add_error(line, (record or {}).get('sku'), error)
+            continue
+        batch.append((line, values))
+        if len(batch) >= batch_rows:
+            flush()
+    if batch:
+        flush()
+    return report
+
+
+def product_export_rows():
+    """صفوف التصدير بترتيب PRODUCT_EXPORT_COLUMNS، تُقرأ على دفعات أثناء الإرسال."""
+    return db.session.execute(
+        select(Product.sku, Product.name, Product.price, Product.stock, Category.name,
+               Product.description, Product.image_url)
+        .outerjoin(Category, Category.id == Product.category_id)
+        .order_by(Product.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+
+
+@app.route('/admin/products/import', methods=['POST'])
+def admin_products_import():
+    """استيراد جماعي: ملف في الحقل file أو جسم الطلب مباشرة، والنتيجة تقرير JSON."""
+    denied = admin_api_denied('products')
+    if denied:
+        return denied
+
+    upload = request.files.get('file')
+    if upload and upload.filename:
+        stream, filename = upload.stream, upload.filename
+    elif request.content_length and not request.files:
+        stream, filename = request.stream, ''
+    else:
+        return jsonify({'error': 'missing_file'}), 400
+    requested = request.args.get('format') or request.form.get('format')
+    if not requested and request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        requested = 'jsonl'
+    fmt = detect_import_format(filename, requested)
+    if fmt is None:
+        return jsonify({'error': 'unsupported_format'}), 400
+
+    return jsonify(import_products(stream, fmt))
+
+
+@app.route('/admin/products/export')
+def admin_products_export():
+    denied = admin_api_denied('products')
+    if denied:
+        return denied
+
+    fmt = detect_import_format('', request.args.get('format'))
+    if fmt is None:
+        return jsonify({'error': 'unsupported_format'}), 400
+    rows = product_export_rows()
+    if fmt == 'csv':
+        return csv_download('products.csv', PRODUCT_EXPORT_COLUMNS, rows)
+    return streaming_download('products.jsonl', jsonl_stream(
+        dict(zip(PRODUCT_EXPORT_COLUMNS, row)) for row in rows
+    ), 'application/x-ndjson')
+
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='الافتراضي حسب امتداد الملف.')
+@click.option('--batch-size', default=IMPORT_BATCH_ROWS, show_default=True)
+def import_products_command(path, fmt, batch_size):
+    """استيراد منتجات من ملف CSV أو JSON Lines (upsert حسب sku)."""
+    with open(path, 'rb') as f:
+        report = import_products(f, detect_import_format(path, fmt), batch_size)
+    print(f"تمت معالجة {report['processed']} سطر: {report['inserted']} جديد، "
+          f"{report['updated']} محدث، {report['error_count']} خطأ.")
+    for error in report['errors']:
+        print(f"  السطر {error['line']} ({error['sku'] or '-'}): {error['error']}")
+
+
+@app.cli.command('export-products')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='الافتراضي حسب امتداد الملف.')
+def export_products_command(path, fmt):
+    """تصدير كل المنتجات إلى ملف CSV أو JSON Lines."""
+    rows = product_export_rows()
+    if detect_import_format(path, fmt) == 'csv':
+        chunks = csv_stream(PRODUCT_EXPORT_COLUMNS, rows)
+    else:
+        chunks = jsonl_stream(dict(zip(PRODUCT_EXPORT_COLUMNS, row)) for row in rows)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    print(f"تم التصدير إلى {path}")
+
+
 @app.route('/manage_admins', methods=['GET'])
 def manage_admins():
     if 'admin_id' not in session:
@@ -678,17 +3542,7 @@ def manage_admins():
     if not current_admin or not current_admin.can_manage_admins:
         flash('ليس لديك صلاحية إدارة المشرفين', 'danger')
         return redirect(url_for('admin_panel'))
-    admins = AdminUser.query.all()
-    activities_raw = AdminActivity.query.order_by(AdminActivity.timestamp.desc()).limit(20).all()
-    activities = []
-    for act in activities_raw:
-        admin = AdminUser.query.get(act.admin_id)
-        activities.append({
-            'timestamp': act.timestamp,
-            'admin_name': admin.username if admin else f'ID {act.admin_id}',
-            'action': act.action
-        })
-    return render_template('manage_admins.html', admins=admins, activities=activities)
+    return render_manage_admins()
 
 
 @app.route('/add_admin', methods=['POST'])
@@ -700,61 +3554,7 @@ def add_admin():
         flash('ليس لديك صلاحية إضافة مشرفين', 'danger')
         return redirect(url_for('manage_admins'))
     username = request.form.get('username')
-    admins = AdminUser.query.order_by(AdminUser.username).all()
-
-    # فلترة النشاطات عبر معلمات GET
-    q = AdminActivity.query
-    admin_filter = request.args.get('admin_id')
-    action_filter = request.args.get('action')
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
-    try:
-        page = int(request.args.get('page', 1))
-    except ValueError:
-        page = 1
-    per_page = 20
-
-    if admin_filter:
-        try:
-            q = q.filter(AdminActivity.admin_id == int(admin_filter))
-        except ValueError:
-            pass
-    if action_filter:
-        q = q.filter(AdminActivity.action.ilike(f"%{action_filter}%"))
-    if date_from:
-        try:
-            dt_from = datetime.fromisoformat(date_from)
-            q = q.filter(AdminActivity.timestamp >= dt_from)
-        except Exception:
-            pass
-    if date_to:
-        try:
-            dt_to = datetime.fromisoformat(date_to)
-            q = q.filter(AdminActivity.timestamp <= dt_to)
-        except Exception:
-            pass
-
-    total_count = q.count()
-    offset = (page - 1) * per_page
-    activities_raw = q.order_by(AdminActivity.timestamp.desc()).offset(offset).limit(per_page).all()
-
-    activities = []
-    for act in activities_raw:
-        admin = AdminUser.query.get(act.admin_id)
-        activities.append({
-            'timestamp': act.timestamp,
-            'admin_name': admin.username if admin else f'ID {act.admin_id}',
-            'action': act.action
-        })
-
-    has_next = offset + per_page < total_count
-    has_prev = page > 1
-
-    return render_template('manage_admins.html', admins=admins, activities=activities,
-                           filters={'admin_id': admin_filter or '', 'action': action_filter or '',
-                                    'date_from': date_from or '', 'date_to': date_to or '',
-                                    'page': page},
-                           pagination={'has_next': has_next, 'has_prev': has_prev, 'page': page})
+    return render_manage_admins()
 
 
 @app.route('/manage_admins/export')
@@ -766,45 +3566,15 @@ def manage_admins_export():
         flash('ليس لديك صلاحية تصدير سجلات المشرفين', 'danger')
         return redirect(url_for('manage_admins'))
 
-    q = AdminActivity.query
-    admin_filter = request.args.get('admin_id')
-    action_filter = request.args.get('action')
-    date_from = request.args.get('date_from')
-    date_to = request.args.get('date_to')
+    # اسم المشرف عبر JOIN، والصفوف تُقرأ على دفعات (yield_per) أثناء الإرسال
+    rows = activity_query(activity_filters(request.args)).order_by(
+        AdminActivity.timestamp.desc(), AdminActivity.id.desc()
+    ).execution_options(yield_per=EXPORT_CHUNK_ROWS)
 
-    if admin_filter:
-        try:
-            q = q.filter(AdminActivity.admin_id == int(admin_filter))
-        except ValueError:
-            pass
-    if action_filter:
-        q = q.filter(AdminActivity.action.ilike(f"%{action_filter}%"))
-    if date_from:
-        try:
-            dt_from = datetime.fromisoformat(date_from)
-            q = q.filter(AdminActivity.timestamp >= dt_from)
-        except Exception:
-            pass
-    if date_to:
-        try:
-            dt_to = datetime.fromisoformat(date_to)
-            q = q.filter(AdminActivity.timestamp <= dt_to)
-        except Exception:
-            pass
-
-    activities = q.order_by(AdminActivity.timestamp.desc()).all()
-
-    import io, csv
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['timestamp', 'admin', 'action'])
-    for act in activities:
-        admin = AdminUser.query.get(act.admin_id)
-        writer.writerow([act.timestamp.isoformat(), admin.username if admin else act.admin_id, act.action])
-
-    resp = app.response_class(output.getvalue(), mimetype='text/csv')
-    resp.headers['Content-Disposition'] = 'attachment; filename=admin_activities.csv'
-    return resp
+    return csv_download('admin_activities.csv', ['timestamp', 'admin', 'action'], (
+        [timestamp.isoformat() if timestamp else '', username or admin_id, action]
+        for _, timestamp, admin_id, action, username in rows
+    ))
     new_admin = AdminUser(
         username=username,
         password_hash=password,
@@ -934,6 +3704,7 @@ def add_product():
     description = request.form.get('description')
     stock = request.form.get('stock')
     category_id = request.form.get('category_id')
+    sku = (request.form.get('sku') or '').strip() or None
 
     image_file = request.files.get('image_file')
     image_url = '/static/placeholder.png'
@@ -947,6 +3718,7 @@ def add_product():
     
     try:
         new_product = Product(
+            sku=sku,
             name=name,
             price=float(price),
             description=description,
@@ -955,12 +3727,20 @@ def add_product():
             category_id=int(category_id)
         )
         db.session.add(new_product)
+        db.session.flush()
+        index_product(new_product)
         db.session.commit()
+        invalidate_cache('catalog')
+        process_product_image(new_product.id, new_product.image_url)
         flash(f'✅ تم إضافة المنتج {name} بنجاح! (إشعار إداري)', 'info')
         return redirect(url_for('admin_panel'))
     except ValueError:
         flash('خطأ: يجب أن يكون السعر ورصيد المخزون أرقاماً صحيحة!', 'error')
         return redirect(url_for('admin_panel'))
+    except IntegrityError:
+        db.session.rollback()
+        flash(f'خطأ: رمز SKU "{sku}" مستخدم لمنتج آخر!', 'error')
+        return redirect(url_for('admin_panel'))
 
 
 @app.route('/edit_product/<int:product_id>', methods=['GET', 'POST'])
@@ -980,15 +3760,24 @@ def edit_product(product_id):
 
             if image_file and image_file.filename != '':
                 image_url = handle_image_upload(image_file)
+            image_changed = image_url != product.image_url
+            if image_changed:
+                # النسخ القديمة تخص الصورة السابقة؛ الجديدة تُولد بعد الحفظ
+                product.image_variants = None
             
+            product.sku = (request.form.get('sku') or '').strip() or None
             product.name = request.form.get('name')
             product.price = float(request.form.get('price'))
             product.description = request.form.get('description')
             product.stock = int(request.form.get('stock'))
             product.image_url = image_url
             product.category_id = int(request.form.get('category_id'))
+            index_product(product)
             
             db.session.commit()
+            invalidate_cache('catalog', f'product:{product_id}')
+            if image_changed:
+                process_product_image(product.id, image_url)
             flash(f'تم تعديل المنتج {product.name} بنجاح!', 'success')
             return redirect(url_for('admin_panel'))
         except:
@@ -1009,8 +3798,10 @@ def delete_product(product_id):
     product = Product.query.get_or_404(product_id)
     product_name = product.name
     
+    unindex_product(product.id)
     db.session.delete(product)
     db.session.commit()
+    invalidate_cache('catalog', f'product:{product_id}')
     
     flash(f'⚠️ تم حذف المنتج {product_name} بنجاح! (إشعار إداري)', 'warning')
     return redirect(url_for('admin_panel'))
@@ -1029,6 +3820,7 @@ def add_category():
         new_category = Category(name=name)
         db.session.add(new_category)
         db.session.commit()
+        invalidate_cache('categories')
         flash(f'تمت إضافة الفئة {name} بنجاح.', 'success')
         return redirect(url_for('admin_panel'))
     flash('خطأ: يجب توفير اسم للفئة.', 'error')
@@ -1050,6 +3842,7 @@ def delete_category(category_id):
     
     db.session.delete(category)
     db.session.commit()
+    invalidate_cache('categories', 'catalog')
     flash(f'تم حذف الفئة {category.name} بنجاح.', 'success')
     return redirect(url_for('admin_panel'))
 
@@ -1066,8 +3859,24 @@ def update_order_status(order_id):
     new_status = request.form.get('status')
     
     if new_status in ['New', 'Processing', 'Shipped', 'Delivered']:
-        order.status = new_status
+        old_status = order.status
+        # تحديث مشروط بالحالة المقروءة: من طلبين متزامنين لنفس الانتقال ينجح واحد فقط،
+        # فلا يُضاف الطلب إلى جداول التجميع مرتين
+        result = db.session.execute(
+            update(Order).where(Order.id == order.id, Order.status == old_status).values(status=new_status)
+        )
+        if result.rowcount != 1:
+            db.session.rollback()
+            flash(f'تغيرت حالة الطلب #{order_id} أثناء التحديث، أعد المحاولة.', 'error')
+            return redirect(url_for('admin_panel'))
+        # تحديث جداول التجميع فقط عند الدخول إلى/الخروج من حالة التسليم
+        if old_status != SALES_STATUS and new_status == SALES_STATUS:
+            apply_sales_rollup(order, 1)
+        elif old_status == SALES_STATUS and new_status != SALES_STATUS:
+            apply_sales_rollup(order, -1)
         db.session.commit()
+        if SALES_STATUS in (old_status, new_status):
+            sales_stats_cache.invalidate('sales')
         flash(f'تم تحديث حالة الطلب #{order_id} إلى {new_status}.', 'success')
         return redirect(url_for('admin_panel'))
         
@@ -1085,46 +3894,194 @@ def order_details(order_id):
     order = Order.query.get_or_404(order_id)
     return render_template('order_details.html', order=order)
 
+# ===== النسخة المتماثلة المحلية (SQLite) =====
+
+@app.cli.command('replica-sync')
+@click.option('--interval', type=float, default=0, help='تكرار النسخ كل N ثانية (0 = مرة واحدة)')
+def replica_sync_command(interval):
+    """بديل محلي للتكرار: نسخ قاعدة SQLite الرئيسية إلى ملف النسخة المتماثلة عبر backup API."""
+    replica = db.engines.get('replica')
+    primary = db.engines[None]
+    if replica is None or primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.UsageError('يتطلب DATABASE_URL و REPLICA_DATABASE_URL بصيغة sqlite:///')
+    while True:
+        source = sqlite3.connect(primary.url.database)
+        target = sqlite3.connect(replica.url.database, timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        print(f"{datetime.now():%H:%M:%S} تمت مزامنة النسخة المتماثلة.")
+        if not interval:
+            break
+        time.sleep(interval)
+
+# ===== أدوات التطوير: خطط تنفيذ الاستعلامات =====
+
+def hot_queries():
+    """الاستعلامات الرئيسية في المسارات الساخنة، مبنية بنفس دوال المسارات لكل ترتيب ومؤشر، لفحص خطط تنفيذها."""
+    now = datetime.utcnow()
+    queries = {}
+
+    # قائمة المنتجات: كل ترتيب، مع فئة ودونها، الصفحة الأولى وصفحة بمؤشر
+    cursor_values = {'relevance': -1.0, 'price': 10.0, 'price_desc': 10.0, 'name': 'm', 'id': 1}
+    for sort in PRODUCT_LISTING_SORTS:
+        search = 'phone' if sort == 'relevance' else None
+        if search and not search_index_available():
+            continue
+        for category_id in (None, 1):
+            for position in (None, (cursor_values[sort], 1)):
+                label = f"api/products: sort={sort}{' category' if category_id else ''}{' cursor' if position else ''}"
+                queries[label] = product_listing_query(
+                    list(PRODUCT_FIELD_COLUMNS), search, category_id, sort, position
+                ).limit(app.config['PRODUCTS_PAGE_SIZE'] + 1).statement
+
+    # أقسام لوحة الإدارة: كل حقل ترتيب بالاتجاهين، وفلاتر الأقسام الشائعة
+    sections = {
+        'admin api products': (admin_products_query, ADMIN_PRODUCT_SORTING, {'category_id': '1'}),
+        'admin api orders': (admin_orders_query, ADMIN_ORDER_SORTING, {'status': 'New'}),
+        'admin api reviews': (admin_reviews_query, ADMIN_REVIEW_SORTING, {'product_id': '1'}),
+        'admin api low stock': (lambda args: low_stock_query(), LOW_STOCK_SORTING, {}),
+    }
+    for name, (build, sorting, filters) in sections.items():
+        for field in sorting[0]:
+            for sort in (field, '-' + field):
+                args = MultiDict({'sort': sort})
+                queries[f'{name}: sort={sort}'] = admin_page_query(build(args), *sorting, args)[0].statement
+        if filters:
+            args = MultiDict(filters)
+            label = f"{name}: {', '.join(f'{k}={v}' for k, v in filters.items())}"
+            queries[label] = admin_page_query(build(args), *sorting, args)[0].statement
+
+    # سجل النشاط: الصفحة الأولى، والأقدم، والأحدث، لكل المشرفين ولمشرف واحد
+    for filters_args in ({}, {'admin_id': '1'}):
+        filters = activity_filters(filters_args)
+        scope = ' admin_id=1' if filters_args else ''
+        queries[f'activity_page:{scope} first'] = activity_page_query(filters).limit(ACTIVITY_PAGE_SIZE + 1).statement
+        for backwards in (False, True):
+            queries[f"activity_page:{scope} {'before' if backwards else 'after'} cursor"] = activity_page_query(
+                filters, (now, 1), backwards
+            ).limit(ACTIVITY_PAGE_SIZE + 1).statement
+
+    queries.update({
+        'product_detail: reviews': select(Review).where(Review.product_id == 1).order_by(Review.date_posted.desc()),
+        'admin_panel: new orders count': select(func.count(Order.id)).where(Order.status == 'New'),
+        'admin_panel: low stock count': select(func.count(Product.id)).where(Product.stock <= LOW_STOCK_THRESHOLD),
+        'order_details: items': select(OrderItem).where(OrderItem.order_id == 1),
+        'sales rollup: delivered orders': select(Order.id).where(Order.status == SALES_STATUS, Order.date_placed >= now - timedelta(days=30)),
+        'purge-carts: stale carts': select(CartItem.sid).where(CartItem.updated_at < now - timedelta(days=30)),
+    })
+    return queries
+
+
+def explain_query(stmt):
+    """يعيد (أسطر الخطة، الأسطر المشبوهة): مسح كامل للجدول أو ترتيب في جدول مؤقت.
+
+    لا يُعد مشبوهاً: مسح جدول بترتيب مفتاحه الأساسي مع LIMIT (صفحة حسب id تتوقف مبكراً)،
+    وترتيب نتائج MATCH في فهرس FTS5 (محدود بعدد النتائج لا بحجم الجدول).
+    """
+    sql = str(stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    connection = db.session.connection()
+    if db.engine.dialect.name == 'sqlite':
+        plan = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql)]
+        pk_ordered = re.search(r'ORDER BY "?(\w+)"?\.id\b', sql) if ' LIMIT ' in sql else None
+        full_match_sort = any('VIRTUAL TABLE' in line for line in plan)
+        flagged = [line for line in plan
+                   if (line.startswith('SCAN ') and ' USING ' not in line and 'VIRTUAL TABLE' not in line
+                       and not (pk_ordered and line == f'SCAN {pk_ordered.group(1)}'))
+                   or ('TEMP B-TREE' in line and not full_match_sort)]
+    else:
+        plan = [row[0] for row in connection.exec_driver_sql('EXPLAIN ' + sql)]
+        flagged = [line.strip() for line in plan if 'Seq Scan' in line]
+    return plan, flagged
+
+
+@app.cli.command('explain-queries')
+@click.option('--verbose', is_flag=True, help='عرض الخطة كاملة لكل استعلام')
+def explain_queries_command(verbose):
+    """فحص خطط تنفيذ الاستعلامات الرئيسية والتنبيه على المسح الكامل (يفشل عند وجوده)."""
+    problems = 0
+    for name, stmt in hot_queries().items():
+        plan, flagged = explain_query(stmt)
+        print(f"{'⚠' if flagged else '✓'} {name}")
+        for line in (plan if verbose else flagged):
+            print(f"    {line}")
+        problems += bool(flagged)
+    print(f"{problems} استعلام بحاجة إلى فهرس.")
+    if problems:
+        raise SystemExit(1)
+
 # ===== التشغيل والإعداد الأولي =====
 
-if __name__ == '__main__':
-    with app.app_context():
-        # التأكد من مجلد الرفع
-        if not os.path.exists(app.config['UPLOAD_FOLDER']):
-            os.makedirs(app.config['UPLOAD_FOLDER'])
-            
-        db.create_all()
-
-        # الإعداد الأولي: إضافة المشرف الرئيسي
-        if AdminUser.query.count() == 0:
-            initial_admin = AdminUser(
-                username=ADMIN_USERNAME_DEFAULT,
-                can_manage_products=True,
-                can_manage_orders=True,
-                can_manage_reviews=True,
-                can_manage_admins=True
-            )
-            initial_admin.set_password(ADMIN_PASSWORD_DEFAULT)
-            db.session.add(initial_admin)
-            db.session.commit()
-            print(f"تم إنشاء المشرف الرئيسي: {ADMIN_USERNAME_DEFAULT}")
-            
-        # إضافة بيانات تجريبية (فئات)
-        if Category.query.count() == 0:
-            tech = Category(name="Electronics")
-            books = Category(name="Books")
-            db.session.add_all([tech, books])
+def bootstrap_database(demo_data=False):
+    """إنشاء الجداول وفهرس البحث والمشرف الرئيسي (وبيانات تجريبية اختيارياً).
+
+    تُشغَّل مرة واحدة قبل تشغيل الخادم (flask init-db) وليس عند بدء كل عامل.
+    """
+    # التأكد من مجلد الرفع
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    fresh = not sa_inspect(db.engine).get_table_names()
+    db.create_all()
+    ensure_search_index()
+    if fresh and os.path.isdir(os.path.join(app.root_path, 'migrations')):
+        # قاعدة جديدة أُنشئت بالكامل من النماذج: نعلّمها بآخر ترحيل
+        from flask_migrate import stamp
+        stamp(directory=os.path.join(app.root_path, 'migrations'))
+
+    # الإعداد الأولي: إضافة المشرف الرئيسي
+    if AdminUser.query.count() == 0:
+        initial_admin = AdminUser(
+            username=os.environ.get('ADMIN_USERNAME', ADMIN_USERNAME_DEFAULT),
+            can_manage_products=True,
+            can_manage_orders=True,
+            can_manage_reviews=True,
+            can_manage_admins=True
+        )
+        initial_admin.set_password(os.environ.get('ADMIN_PASSWORD', ADMIN_PASSWORD_DEFAULT))
+        db.session.add(initial_admin)
+        db.session.commit()
+        print(f"تم إنشاء المشرف الرئيسي: {initial_admin.username}")
+
+    if not demo_data:
+        return
+
+    # إضافة بيانات تجريبية (فئات)
+    if Category.query.count() == 0:
+        tech = Category(name="Electronics")
+        books = Category(name="Books")
+        db.session.add_all([tech, books])
+        db.session.commit()
+
+    # إضافة بيانات تجريبية (منتجات)
+    if Product.query.count() == 0:
+        tech = Category.query.filter_by(name="Electronics").first()
+        books = Category.query.filter_by(name="Books").first()
+
+        if tech and books:
+            db.session.add(Product(name="Laptop Pro", price=1200.0, description="Powerful machine for development and gaming.", stock=10, image_url="/static/placeholder.png", category_id=tech.id))
+            db.session.add(Product(name="Wireless Mouse", price=25.0, description="Ergonomic design with high precision sensor.", stock=50, image_url="/static/placeholder.png", category_id=tech.id))
+            db.session.add(Product(name="Python Guide", price=50.0, description="Beginner's guide to Python and Flask.", stock=20, image_url="/static/placeholder.png", category_id=books.id))
             db.session.commit()
+            rebuild_search_index()
 
-        # إضافة بيانات تجريبية (منتجات)
-        if Product.query.count() == 0:
-            tech = Category.query.filter_by(name="Electronics").first()
-            books = Category.query.filter_by(name="Books").first()
 
-            if tech and books:
-                db.session.add(Product(name="Laptop Pro", price=1200.0, description="Powerful machine for development and gaming.", stock=10, image_url="/static/placeholder.png", category_id=tech.id))
-                db.session.add(Product(name="Wireless Mouse", price=25.0, description="Ergonomic design with high precision sensor.", stock=50, image_url="/static/placeholder.png", category_id=tech.id))
-                db.session.add(Product(name="Python Guide", price=50.0, description="Beginner's guide to Python and Flask.", stock=20, image_url="/static/placeholder.png", category_id=books.id))
-                db.session.commit()
+@app.cli.command('init-db')
+@click.option('--demo', is_flag=True, help='إضافة فئات ومنتجات تجريبية')
+def init_db_command(demo):
+    """تهيئة قاعدة البيانات قبل التشغيل (الجداول، فهرس البحث، المشرف الرئيسي)."""
+    bootstrap_database(demo_data=demo)
+    print("تمت تهيئة قاعدة البيانات.")
+
+
+if __name__ == '__main__':
+    # خادم التطوير فقط؛ للإنتاج استخدم wsgi.py مع gunicorn أو ما يماثله
+    with app.app_context():
+        bootstrap_database(demo_data=True)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    debug = os.environ.get('FLASK_DEBUG', '1') == '1'
+    # مع المعيد التلقائي للتحميل يعمل الخادم في العملية الابنة فقط
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_worker_thread()
+    app.run(debug=debug, host='0.0.0.0', port=5000)
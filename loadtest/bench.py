@@ -0,0 +1,376 @@
+"""قياس أداء قابل للتكرار لأهم المسارات على بيانات اصطناعية.
+
+يبني قاعدة SQLite مؤقتة بحجم قابل للضبط (منتجات، تقييمات، طلبات، نشاطات مشرفين) بمولد عشوائي
+ثابت البذرة، ثم يشغل كل سيناريو عبر Flask test client ويقيس لكل مسار:
+- الإنتاجية (طلب/ثانية) وزمن الاستجابة (p50/p90/p99/max بالملي ثانية).
+- عدد استعلامات SQL لكل طلب.
+- ذروة الذاكرة المخصصة أثناء الطلب (tracemalloc، في جولة منفصلة حتى لا يشوه التوقيت).
+
+الاستخدام:
+    python loadtest/bench.py --products 5000 --orders 20000 --output bench.json
+    python loadtest/bench.py --output new.json --compare bench.json --threshold 0.25
+    python loadtest/bench.py --current new.json --compare bench.json     # مقارنة فقط دون تشغيل
+
+في وضع المقارنة يخرج بالرمز 1 إذا تراجع أي مقياس أكثر من الحد المسموح.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ['laptop', 'phone', 'book', 'mouse', 'cable', 'camera', 'watch', 'lamp', 'chair', 'desk',
+         'guide', 'speaker', 'monitor', 'keyboard', 'bag', 'bottle', 'charger', 'tablet']
+ADJECTIVES = ['pro', 'mini', 'classic', 'smart', 'ultra', 'eco', 'wireless', 'deluxe']
+STATUSES = ['New', 'Processing', 'Shipped', 'Delivered', 'Delivered', 'Delivered', 'COD']
+ADMIN_PASSWORD = 'bench-password'
+# تاريخ ثابت بدل الوقت الحالي حتى تتطابق البيانات بين التشغيلات
+EPOCH = datetime(2026, 1, 1)
+
+# (المقياس، هل الزيادة تراجع؟) — الإنتاجية وحدها الأعلى فيها أفضل
+METRICS = [
+    ('latency_ms.p50', True),
+    ('latency_ms.p90', True),
+    ('latency_ms.p99', True),
+    ('throughput_rps', False),
+    ('queries_per_request', True),
+    ('peak_memory_kb', True),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--activities', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42, help='بذرة المولد العشوائي للبيانات والسيناريوهات')
+    parser.add_argument('--iterations', type=int, default=200, help='عدد الطلبات المقاسة لكل سيناريو')
+    parser.add_argument('--warmup', type=int, default=20, help='طلبات إحماء غير مقاسة لكل سيناريو')
+    parser.add_argument('--memory-samples', type=int, default=3, help='طلبات جولة قياس الذاكرة')
+    parser.add_argument('--only', help='أسماء سيناريوهات مفصولة بفواصل')
+    parser.add_argument('--response-cache', action='store_true',
+                        help='تفعيل ذاكرة الاستجابات (معطلة افتراضياً لقياس العمل الفعلي)')
+    parser.add_argument('--database-url', help='قاعدة بيانات بديلة (تُمسح جداولها!)')
+    parser.add_argument('--output', help='ملف JSON للنتائج (الافتراضي: الطباعة فقط)')
+    parser.add_argument('--compare', metavar='BASELINE', help='ملف نتائج سابق للمقارنة به')
+    parser.add_argument('--current', metavar='RESULTS', help='نتائج جاهزة للمقارنة بدل التشغيل')
+    parser.add_argument('--threshold', type=float, default=0.25, help='نسبة التراجع المسموحة (0.25 = 25%%)')
+    parser.add_argument('--min-latency-delta-ms', type=float, default=1.0,
+                        help='فروق الزمن الأصغر من هذا تُعد ضجيجاً ولا تُحسب تراجعاً')
+    return parser.parse_args()
+
+
+# ===== البيانات الاصطناعية =====
+
+def seed_dataset(args):
+    from sqlalchemy import bindparam, insert
+    from app import (db, Category, Product, Review, Order, OrderItem, AdminUser, AdminActivity,
+                     rebuild_sales_rollup, rebuild_search_index)
+
+    rng = random.Random(args.seed)
+    db.drop_all()
+    db.create_all()
+
+    def bulk(model, rows, chunk=5000):
+        for start in range(0, len(rows), chunk):
+            db.session.execute(insert(model), rows[start:start + chunk])
+
+    bulk(Category, [{'id': i, 'name': f'Category {i}'} for i in range(1, args.categories + 1)])
+
+    products = []
+    for i in range(1, args.products + 1):
+        name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(WORDS).title()} {i}'
+        products.append({
+            'id': i, 'sku': f'SKU-{i:07d}', 'name': name, 'price': round(rng.uniform(1, 2000), 2),
+            'description': ' '.join(rng.choice(WORDS) for _ in range(12)),
+            'stock': rng.randint(0, 10 ** 6), 'category_id': rng.randint(1, args.categories),
+            'updated_at': EPOCH
+        })
+    bulk(Product, products)
+
+    ratings = {}
+    reviews = []
+    for i in range(1, args.reviews + 1):
+        product_id, rating = rng.randint(1, args.products), rng.randint(1, 5)
+        total, count = ratings.get(product_id, (0, 0))
+        ratings[product_id] = (total + rating, count + 1)
+        reviews.append({'id': i, 'product_id': product_id, 'rating': rating, 'comment': 'bench review',
+                        'reviewer_name': f'user{rng.randint(1, 500)}',
+                        'date_posted': EPOCH - timedelta(minutes=rng.randint(0, 525600))})
+    bulk(Review, reviews)
+    db.session.execute(
+        Product.__table__.update().where(Product.id == bindparam('pid')).values(
+            rating_sum=bindparam('rating_sum'), rating_count=bindparam('rating_count')),
+        [{'pid': pid, 'rating_sum': total, 'rating_count': count} for pid, (total, count) in ratings.items()]
+    )
+
+    orders, items = [], []
+    for i in range(1, args.orders + 1):
+        lines = [products[rng.randrange(args.products)] for _ in range(rng.randint(1, 3))]
+        quantities = [rng.randint(1, 3) for _ in lines]
+        orders.append({
+            'id': i, 'customer_name': f'Customer {i}', 'customer_email': f'c{i}@example.com',
+            'total_price': round(sum(p['price'] * q for p, q in zip(lines, quantities)), 2),
+            'date_placed': EPOCH - timedelta(minutes=rng.randint(0, 525600)), 'status': rng.choice(STATUSES)
+        })
+        items.extend({'order_id': i, 'product_name': p['name'], 'price': p['price'], 'quantity': q,
+                      'product_id': p['id'], 'category_id': p['category_id']} for p, q in zip(lines, quantities))
+    bulk(Order, orders)
+    bulk(OrderItem, items)
+
+    admin = AdminUser(username='bench', can_manage_products=True, can_manage_orders=True,
+                      can_manage_reviews=True, can_manage_admins=True)
+    admin.set_password(ADMIN_PASSWORD)
+    db.session.add(admin)
+    db.session.add_all(AdminUser(username=f'staff{i}', password_hash='x') for i in range(1, 10))
+    db.session.flush()
+    admin_ids = [admin.id for admin in AdminUser.query]
+    bulk(AdminActivity, [{'admin_id': rng.choice(admin_ids),
+                          'action': f'{rng.choice(["edit", "add", "delete"])} product {i}',
+                          'timestamp': EPOCH - timedelta(seconds=rng.randint(0, 3 * 10 ** 7))}
+                         for i in range(1, args.activities + 1)])
+    db.session.commit()
+
+    rebuild_sales_rollup()
+    rebuild_search_index()
+
+
+# ===== السيناريوهات =====
+
+def build_scenarios(app, args):
+    """قائمة (الاسم، تجهيز غير مقاس، إرسال الطلب) لكل سيناريو؛ المعاملات تتغير بمولد ثابت البذرة."""
+    rng = random.Random(args.seed + 1)
+    product_id = lambda: rng.randint(1, args.products)
+    visible_ids = lambda count: ','.join(str(rng.randint(1, count)) for _ in range(25))
+
+    shopper = app.test_client()
+    for _ in range(3):
+        shopper.get(f'/cart/add/{product_id()}')
+
+    buyer = app.test_client()
+
+    admin = app.test_client()
+    admin.post('/admin/login', data={'username': 'bench', 'password': ADMIN_PASSWORD})
+    admin.get('/admin')  # استهلاك رسالة الترحيب حتى لا تتجاوز الصفحات ذاكرة الاستجابات
+
+    nothing = lambda: None
+    return [
+        ('api_products', nothing, lambda: shopper.get('/api/products')),
+        ('api_products_query', nothing, lambda: shopper.get(f'/api/products?query={rng.choice(WORDS)}')),
+        ('api_products_category', nothing,
+         lambda: shopper.get(f'/api/products?category_id={rng.randint(1, args.categories)}')),
+        ('product_detail', nothing, lambda: shopper.get(f'/product/{product_id()}')),
+        ('cart', nothing, lambda: shopper.get('/cart')),
+        ('checkout', lambda: buyer.get(f'/cart/add/{product_id()}'),
+         lambda: buyer.post('/checkout', data={'name': 'Bench', 'email': 'bench@example.com'})),
+        ('admin_panel', nothing, lambda: admin.get('/admin')),
+        ('admin_pricing_data', nothing, lambda: admin.get(
+            f'/admin/pricing_data?product_ids={visible_ids(args.products)}&order_ids={visible_ids(args.orders)}')),
+        ('manage_admins', nothing, lambda: admin.get('/manage_admins')),
+        ('manage_admins_export', nothing, lambda: admin.get('/manage_admins/export')),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(prepare, send, args, query_counter):
+    def request_once():
+        response = send()
+        response.get_data()  # استهلاك الاستجابات المتدفقة بالكامل
+        return response.status_code
+
+    for _ in range(args.warmup):
+        prepare()
+        request_once()
+
+    latencies, statuses, queries = [], {}, 0
+    elapsed = 0.0
+    for _ in range(args.iterations):
+        prepare()
+        query_counter[0] = 0
+        started = time.perf_counter()
+        status = request_once()
+        duration = time.perf_counter() - started
+        elapsed += duration
+        latencies.append(duration * 1000)
+        queries += query_counter[0]
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    peak = 0
+    for _ in range(args.memory_samples):
+        prepare()
+        tracemalloc.start()
+        request_once()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'iterations': args.iterations,
+        'throughput_rps': round(args.iterations / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies), 3),
+            'p50': round(percentile(latencies, 0.50), 3),
+            'p90': round(percentile(latencies, 0.90), 3),
+            'p99': round(percentile(latencies, 0.99), 3),
+            'max': round(latencies[-1], 3)
+        },
+        'queries_per_request': round(queries / args.iterations, 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'status': statuses
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(args):
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='homy-bench-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ.setdefault('RESPONSE_CACHE_ENABLED', '1' if args.response_cache else '0')
+
+    from sqlalchemy import event
+    from app import app, db
+
+    app.config['TESTING'] = True
+    app.config['RESPONSE_CACHE_ENABLED'] = args.response_cache
+    app.logger.setLevel('ERROR')
+
+    results = {}
+    with app.app_context():
+        started = time.perf_counter()
+        seed_dataset(args)
+        seed_seconds = time.perf_counter() - started
+
+        query_counter = [0]
+
+        def count_query(*_):
+            query_counter[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+        selected = set(args.only.split(',')) if args.only else None
+        for name, prepare, send in build_scenarios(app, args):
+            if selected and name not in selected:
+                continue
+            results[name] = run_scenario(prepare, send, args, query_counter)
+            latency = results[name]['latency_ms']
+            print(f"{name:24} {results[name]['throughput_rps']:>9} req/s  p50={latency['p50']:.2f}ms "
+                  f"p99={latency['p99']:.2f}ms  queries={results[name]['queries_per_request']}  "
+                  f"peak={results[name]['peak_memory_kb']}KB", file=sys.stderr)
+        event.remove(db.engine, 'before_cursor_execute', count_query)
+
+    if tmpdir:
+        import shutil
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed_seconds': round(seed_seconds, 2),
+            'scale': {name: getattr(args, name) for name in ('products', 'categories', 'reviews', 'orders', 'activities')},
+            'seed': args.seed,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'response_cache': args.response_cache
+        },
+        'results': results
+    }
+
+
+# ===== المقارنة =====
+
+def metric_value(result, path):
+    value = result
+    for part in path.split('.'):
+        value = value[part]
+    return value
+
+
+def compare(baseline, current, threshold, min_latency_delta):
+    """قائمة التراجعات: كل مقياس ساء بأكثر من threshold (نسبياً) في سيناريو موجود في الملفين."""
+    if baseline['meta'].get('scale') != current['meta'].get('scale'):
+        print('تحذير: حجم البيانات مختلف بين الملفين، المقارنة غير دقيقة', file=sys.stderr)
+    regressions = []
+    for name, base in sorted(baseline['results'].items()):
+        now = current['results'].get(name)
+        if now is None:
+            continue
+        if sorted(now['status']) != sorted(base['status']):
+            # رموز استجابة جديدة (أخطاء مثلاً) تجعل مقارنة الزمن بلا معنى
+            regressions.append(f"{name:24} {'status':20} {sorted(base['status'])} -> {sorted(now['status'])}")
+        for path, higher_is_worse in METRICS:
+            old, new = metric_value(base, path), metric_value(now, path)
+            if path.startswith('latency_ms') and abs(new - old) < min_latency_delta:
+                continue
+            if higher_is_worse:
+                regressed = new > old * (1 + threshold) if old else new > 0
+            else:
+                regressed = new < old * (1 - threshold)
+            change = (new - old) / old * 100 if old else float('inf')
+            line = f"{name:24} {path:20} {old:>10} -> {new:<10} ({change:+.1f}%)"
+            if regressed:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    args = parse_args()
+    if args.current:
+        with open(args.current, encoding='utf-8') as f:
+            report = json.load(f)
+    else:
+        report = run_benchmarks(args)
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            print(output)
+
+    if not args.compare:
+        return 0
+    with open(args.compare, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, report, args.threshold, args.min_latency_delta_ms)
+    if regressions:
+        print(f'تراجع أكثر من {args.threshold:.0%}:', file=sys.stderr)
+        for line in regressions:
+            print('  ' + line, file=sys.stderr)
+        return 1
+    print('لا تراجع مقارنة بـ ' + args.compare, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""اختبار الإرسال المكرر المتزامن لـ checkout والدفع (النقر المزدوج وإعادة المحاولة).
+
+كل عميل يرسل نفس نموذج checkout (نفس idempotency_key ونفس الجلسة) عدة مرات في نفس اللحظة،
+ثم يكرر طلب /payment/process/<order_id> بالتوازي. يتحقق من:
+- طلب واحد فقط لكل عميل، وكل الإرسالات المكررة وُجهت إلى نفس العنوان.
+- خصم المخزون مرة واحدة: المخزون النهائي = الابتدائي - (العملاء × الكمية).
+- مهمة تأكيد دفع واحدة لكل طلب، والطلب يصبح Paid بعد تشغيل العامل.
+
+الاستخدام:
+    python loadtest/duplicate_checkout.py --customers 8 --duplicates 8
+
+يعمل على قاعدة SQLite مؤقتة (أو DATABASE_URL إن تم تمريرها بـ --database-url).
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=8, help='عدد العملاء (لكل منهم سلة وطلب واحد)')
+    parser.add_argument('--duplicates', type=int, default=8, help='عدد الإرسالات المتزامنة لكل عميل')
+    parser.add_argument('--quantity', type=int, default=2, help='الكمية في كل سلة')
+    parser.add_argument('--rounds', type=int, default=3, help='عدد مرات تكرار الاختبار')
+    parser.add_argument('--database-url', help='قاعدة بيانات بديلة (تُمسح جداولها!)')
+    return parser.parse_args()
+
+
+def fire(requests):
+    """تنفيذ كل الطلبات في نفس اللحظة؛ requests قائمة دوال بلا وسائط تعيد الاستجابة."""
+    barrier = threading.Barrier(len(requests))
+
+    def run(send):
+        barrier.wait()
+        return send()
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as pool:
+        return list(pool.map(run, requests))
+
+
+def main():
+    args = parse_args()
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='homy-duplicate-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'duplicate.db')
+
+    from app import app, db, Category, Product, Order, OrderItem, Job, work_jobs
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        category = Category(name='Duplicate')
+        db.session.add(category)
+        db.session.commit()
+        category_id = category.id
+
+    initial_stock = args.customers * args.quantity * 2
+    failures = 0
+    for round_no in range(1, args.rounds + 1):
+        with app.app_context():
+            product = Product(name=f'DUP-{round_no}', price=10.0, stock=initial_stock, category_id=category_id)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+
+        # لكل عميل: سلة ونموذج checkout واحد، ثم نسخ جلسته إلى عدة عملاء اختبار (كأنها نفس المتصفح)
+        checkout_requests = []
+        customers = []
+        for _ in range(args.customers):
+            client = app.test_client()
+            for _ in range(args.quantity):
+                client.get(f'/cart/add/{product_id}')
+            page = client.get('/checkout').get_data(as_text=True)
+            key = re.search(r'name="idempotency_key" value="([^"]+)"', page).group(1)
+            cookie = client.get_cookie('session').value
+            form = {'name': 'Dup', 'email': 'dup@example.com', 'payment_method': 'online', 'idempotency_key': key}
+            tabs = []
+            for _ in range(args.duplicates):
+                tab = app.test_client()
+                tab.set_cookie('session', cookie)
+                tabs.append(tab)
+                checkout_requests.append(lambda tab=tab: tab.post('/checkout', data=form))
+            customers.append(tabs)
+
+        checkout_responses = fire(checkout_requests)
+        locations = [response.headers.get('Location') for response in checkout_responses]
+        per_customer = [set(locations[i * args.duplicates:(i + 1) * args.duplicates]) for i in range(args.customers)]
+
+        payment_requests = []
+        for tabs, customer_locations in zip(customers, per_customer):
+            location = next(iter(customer_locations))
+            payment_requests.extend(lambda tab=tab, location=location: tab.get(location) for tab in tabs)
+        payment_responses = fire(payment_requests)
+
+        with app.app_context():
+            final_stock = db.session.get(Product, product_id).stock
+            order_ids = [order_id for (order_id,) in db.session.query(OrderItem.order_id).filter(
+                OrderItem.product_id == product_id
+            ).distinct()]
+            payment_jobs = Job.query.filter(
+                Job.kind == 'payment.confirm', Job.payload['order_id'].as_integer().in_(order_ids)
+            ).count()
+            work_jobs('duplicate-checkout', 0, once=True)
+            paid = Order.query.filter(Order.id.in_(order_ids), Order.status == 'Paid').count()
+
+        redirects_ok = all(response.status_code == 303 for response in checkout_responses + payment_responses)
+        ok = (
+            redirects_ok
+            and all(len(customer_locations) == 1 for customer_locations in per_customer)
+            and len(order_ids) == args.customers
+            and final_stock == initial_stock - args.customers * args.quantity
+            and payment_jobs == args.customers
+            and paid == args.customers
+        )
+        failures += 0 if ok else 1
+        print(f"round {round_no}: submissions={len(checkout_responses)} orders={len(order_ids)} "
+              f"stock={initial_stock}->{final_stock} payment_jobs={payment_jobs} paid={paid} "
+              f"redirects_ok={redirects_ok} -> {'OK' if ok else 'FAIL'}")
+
+    if tmpdir:
+        import shutil
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
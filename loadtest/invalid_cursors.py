@@ -0,0 +1,92 @@
+"""فحص مؤشرات الصفحات غير الصالحة في /api/products لكل ترتيب.
+
+المؤشر يأتي من العميل (base64 لـ JSON)؛ قيمة ترتيب من نوع خاطئ (قائمة، قاموس، null، bool، عدد خارج المدى)
+يجب أن تعيد 400 invalid_cursor لا 500 ولا صفحة فارغة. يتحقق أيضاً من أن التصفح بالمؤشرات الصحيحة
+يعيد كل المنتجات مرة واحدة بالترتيب المتوقع.
+
+الاستخدام:
+    python loadtest/invalid_cursors.py
+"""
+import base64
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BAD_VALUES = [[1], {'a': 1}, None, True, 2 ** 70, 'x', 1.5]
+# القيم المقبولة لكل ترتيب (الباقي من BAD_VALUES يجب أن يُرفض)
+ACCEPTED = {
+    'price': (1.5,),
+    'price_desc': (1.5,),
+    'relevance': (1.5,),
+    'name': ('x',),
+    'id': (),
+}
+
+
+def encode(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def main():
+    tmpdir = tempfile.mkdtemp(prefix='homy-cursors-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'cursors.db')
+
+    from app import app, db, Category, Product, ensure_search_index, reindex_products
+
+    app.config['TESTING'] = True
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        ensure_search_index()
+        category = Category(name='Cursors')
+        db.session.add(category)
+        db.session.commit()
+        db.session.add_all([Product(name=f'Cursor item {i % 7}', price=float(i % 5), stock=1, category_id=category.id)
+                            for i in range(40)])
+        db.session.commit()
+        reindex_products([product_id for (product_id,) in db.session.query(Product.id)])
+        expected = {
+            'price': [p.id for p in sorted(Product.query.all(), key=lambda p: (p.price, p.id))],
+            'price_desc': [p.id for p in sorted(Product.query.all(), key=lambda p: (-p.price, -p.id))],
+            'name': [p.id for p in sorted(Product.query.all(), key=lambda p: (p.name, p.id))],
+            'id': sorted(p.id for p in Product.query.all()),
+        }
+
+    client = app.test_client()
+    failures = 0
+    for sort, accepted in ACCEPTED.items():
+        search = '&query=Cursor' if sort == 'relevance' else ''
+        for value in BAD_VALUES + [1]:
+            for last_id in (1, None, 2 ** 70):
+                ok_value = value in accepted or (type(value) is int and value == 1 and sort != 'name')
+                response = client.get(f'/api/products?sort={sort}{search}&cursor={encode([value, last_id])}')
+                should_pass = ok_value and last_id == 1
+                if response.status_code != (200 if should_pass else 400):
+                    failures += 1
+                    print(f"FAIL sort={sort} cursor={[value, last_id]!r} -> {response.status_code}")
+
+        if sort in expected:
+            ids, cursor = [], None
+            while True:
+                url = f'/api/products?sort={sort}&limit=6&fields=id' + (f'&cursor={cursor}' if cursor else '')
+                data = client.get(url).get_json()
+                ids += [item['id'] for item in data['items']]
+                cursor = data['next_cursor']
+                if not cursor:
+                    break
+            if ids != expected[sort]:
+                failures += 1
+                print(f"FAIL sort={sort}: pagination returned {len(ids)} items out of order")
+
+    print(f"{'OK' if not failures else f'{failures} failures'}")
+    import shutil
+    shutil.rmtree(tmpdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
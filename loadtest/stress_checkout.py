@@ -0,0 +1,114 @@
+"""اختبار ضغط للتزامن في checkout: طلبات متوازية كثيرة على نفس المنتج.
+
+يتحقق من عدم البيع بأكثر من المخزون (zero oversell):
+- المخزون النهائي لا يقل عن صفر.
+- مجموع الكميات في الطلبات الناجحة = المخزون الابتدائي - المخزون النهائي.
+- عدد الطلبات الناجحة لا يتجاوز ما يسمح به المخزون.
+
+الاستخدام:
+    python loadtest/stress_checkout.py --workers 64 --stock 25 --quantity 1
+
+يعمل على قاعدة SQLite مؤقتة (أو DATABASE_URL إن تم تمريرها بـ --database-url).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=64, help='عدد عمليات الدفع المتوازية')
+    parser.add_argument('--stock', type=int, default=25, help='المخزون الابتدائي للمنتج')
+    parser.add_argument('--quantity', type=int, default=1, help='الكمية في كل سلة')
+    parser.add_argument('--rounds', type=int, default=3, help='عدد مرات تكرار الاختبار')
+    parser.add_argument('--database-url', help='قاعدة بيانات بديلة (تُمسح جداولها!)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='homy-stress-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'stress.db')
+
+    from app import app, db, Category, Product, Order, OrderItem
+
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        category = Category(name='Stress')
+        db.session.add(category)
+        db.session.commit()
+        category_id = category.id
+
+    failures = 0
+    for round_no in range(1, args.rounds + 1):
+        with app.app_context():
+            product = Product(name=f'SKU-{round_no}', price=10.0, stock=args.stock, category_id=category_id)
+            db.session.add(product)
+            db.session.commit()
+            product_id = product.id
+
+        # تجهيز سلة لكل عميل ثم إطلاق الدفع للجميع في نفس اللحظة
+        clients = []
+        for _ in range(args.workers):
+            client = app.test_client()
+            for _ in range(args.quantity):
+                client.get(f'/cart/add/{product_id}')
+            clients.append(client)
+
+        barrier = threading.Barrier(args.workers)
+
+        def place_order(client):
+            barrier.wait()
+            response = client.post('/checkout', data={'name': 'Stress', 'email': 'stress@example.com'})
+            return response.status_code
+
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            statuses = list(pool.map(place_order, clients))
+
+        with app.app_context():
+            final_stock = db.session.get(Product, product_id).stock
+            ordered = db.session.query(db.func.coalesce(db.func.sum(OrderItem.quantity), 0)).filter(
+                OrderItem.product_id == product_id
+            ).scalar()
+            orders = db.session.query(db.func.count(db.distinct(OrderItem.order_id))).filter(
+                OrderItem.product_id == product_id
+            ).scalar()
+            orphan_orders = Order.query.filter(~Order.items.any()).count()
+
+        succeeded = statuses.count(303)
+        rejected = statuses.count(409)
+        other = len(statuses) - succeeded - rejected
+        expected_orders = min(args.workers, args.stock // args.quantity)
+
+        ok = (
+            final_stock >= 0
+            and ordered == args.stock - final_stock
+            and orders == succeeded
+            and succeeded == expected_orders
+            and orphan_orders == 0
+            and other == 0
+        )
+        failures += 0 if ok else 1
+        print(f"round {round_no}: succeeded={succeeded} rejected={rejected} other={other} "
+              f"final_stock={final_stock} ordered={ordered} orphan_orders={orphan_orders} "
+              f"-> {'OK' if ok else 'FAIL'}")
+
+    if tmpdir:
+        import shutil
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
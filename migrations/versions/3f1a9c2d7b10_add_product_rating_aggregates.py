@@ -0,0 +1,43 @@
+"""add product rating aggregates
+
+Revision ID: 3f1a9c2d7b10
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # قد تكون الأعمدة موجودة إذا أُنشئت القاعدة عبر db.create_all()
+    existing = _columns('product')
+    with op.batch_alter_table('product') as batch_op:
+        if 'rating_sum' not in existing:
+            batch_op.add_column(sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'))
+        if 'rating_count' not in existing:
+            batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # تعبئة المجاميع من التقييمات الحالية في استعلام واحد
+    op.execute("""
+        UPDATE product SET
+            rating_sum = COALESCE((SELECT SUM(review.rating) FROM review WHERE review.product_id = product.id), 0),
+            rating_count = (SELECT COUNT(*) FROM review WHERE review.product_id = product.id)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_column('rating_count')
+        batch_op.drop_column('rating_sum')
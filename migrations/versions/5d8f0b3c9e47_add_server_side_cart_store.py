@@ -0,0 +1,42 @@
+"""add server-side cart and favorites tables
+
+Revision ID: 5d8f0b3c9e47
+Revises: c47d2a9e5f81
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8f0b3c9e47'
+down_revision = 'c47d2a9e5f81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if 'cart_item' not in tables:
+        op.create_table(
+            'cart_item',
+            sa.Column('sid', sa.String(length=32), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('sid', 'product_id')
+        )
+    if 'favorite_item' not in tables:
+        op.create_table(
+            'favorite_item',
+            sa.Column('sid', sa.String(length=32), nullable=False),
+            sa.Column('product_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('sid', 'product_id')
+        )
+
+
+def downgrade():
+    op.drop_table('favorite_item')
+    op.drop_table('cart_item')
@@ -0,0 +1,40 @@
+"""add product full-text search index
+
+Revision ID: 8b2e4d6f1a33
+Revises: 3f1a9c2d7b10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6f1a33'
+down_revision = '3f1a9c2d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 خاص بـ SQLite؛ القواعد الأخرى تعود للبحث بـ LIKE
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+        "name, description, category_name, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    op.execute("INSERT INTO product_search(product_search, rank) VALUES ('rank', 'bm25(10.0, 1.0, 3.0)')")
+    op.execute("DELETE FROM product_search")
+    op.execute(
+        "INSERT INTO product_search(rowid, name, description, category_name) "
+        "SELECT product.id, product.name, COALESCE(product.description, ''), COALESCE(category.name, '') "
+        "FROM product LEFT JOIN category ON category.id = product.category_id"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS product_search")
@@ -0,0 +1,43 @@
+"""add indexes for hot filter and sort columns
+
+Revision ID: a3c5e7f90b12
+Revises: e19a6c4b2d58
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e7f90b12'
+down_revision = 'e19a6c4b2d58'
+branch_labels = None
+depends_on = None
+
+# (اسم الفهرس، الجدول، الأعمدة) — مطابقة لـ __table_args__ في النماذج
+INDEXES = [
+    ('ix_review_product_id_date_posted', 'review', ['product_id', 'date_posted']),
+    ('ix_review_date_posted', 'review', ['date_posted']),
+    ('ix_order_status_date_placed', 'order', ['status', 'date_placed']),
+    ('ix_order_date_placed', 'order', ['date_placed']),
+    ('ix_order_item_order_id', 'order_item', ['order_id']),
+    ('ix_product_category_id', 'product', ['category_id']),
+    ('ix_product_stock', 'product', ['stock']),
+    ('ix_admin_activity_admin_id_timestamp', 'admin_activity', ['admin_id', 'timestamp']),
+    ('ix_admin_activity_timestamp', 'admin_activity', ['timestamp']),
+    ('ix_cart_item_updated_at', 'cart_item', ['updated_at']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # قد تكون موجودة إذا أُنشئت القاعدة عبر db.create_all()
+        if name not in {ix['name'] for ix in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
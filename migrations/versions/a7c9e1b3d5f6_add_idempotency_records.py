@@ -0,0 +1,34 @@
+"""add idempotency records for checkout and payment
+
+Revision ID: a7c9e1b3d5f6
+Revises: f3a5c7e9b1d2
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1b3d5f6'
+down_revision = 'f3a5c7e9b1d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'idempotency_record' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        'idempotency_record',
+        sa.Column('key', sa.String(length=64), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('location', sa.String(length=200), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_idempotency_record_created_at', 'idempotency_record', ['created_at'])
+
+
+def downgrade():
+    op.drop_table('idempotency_record')
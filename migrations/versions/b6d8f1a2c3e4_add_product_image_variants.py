@@ -0,0 +1,29 @@
+"""add product image variants
+
+Revision ID: b6d8f1a2c3e4
+Revises: a3c5e7f90b12
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d8f1a2c3e4'
+down_revision = 'a3c5e7f90b12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('product')}
+    if 'image_variants' not in existing:
+        with op.batch_alter_table('product') as batch_op:
+            batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+    # الصور الحالية تُعالج لاحقاً عبر: flask build-image-variants
+
+
+def downgrade():
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_column('image_variants')
@@ -0,0 +1,68 @@
+"""add daily sales rollup tables
+
+Revision ID: c47d2a9e5f81
+Revises: 8b2e4d6f1a33
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47d2a9e5f81'
+down_revision = '8b2e4d6f1a33'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+    item_columns = {c['name'] for c in inspector.get_columns('order_item')}
+
+    with op.batch_alter_table('order_item') as batch_op:
+        if 'product_id' not in item_columns:
+            batch_op.add_column(sa.Column('product_id', sa.Integer(), nullable=True))
+        if 'category_id' not in item_columns:
+            batch_op.add_column(sa.Column('category_id', sa.Integer(), nullable=True))
+
+    if 'daily_sales' not in tables:
+        op.create_table(
+            'daily_sales',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('total', sa.Float(), nullable=False),
+            sa.Column('orders_count', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('day')
+        )
+    if 'daily_category_sales' not in tables:
+        op.create_table(
+            'daily_category_sales',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('category_id', sa.Integer(), nullable=False),
+            sa.Column('total', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'category_id')
+        )
+
+    # تعبئة أولية من الطلبات المكتملة الحالية (العناصر القديمة بدون فئة تُجمع تحت 0)
+    op.execute('DELETE FROM daily_category_sales')
+    op.execute('DELETE FROM daily_sales')
+    op.execute(
+        'INSERT INTO daily_sales (day, total, orders_count) '
+        'SELECT date(date_placed), SUM(total_price), COUNT(*) FROM "order" '
+        "WHERE status = 'Delivered' GROUP BY date(date_placed)"
+    )
+    op.execute(
+        'INSERT INTO daily_category_sales (day, category_id, total) '
+        'SELECT date(o.date_placed), COALESCE(i.category_id, 0), SUM(i.price * i.quantity) '
+        'FROM order_item i JOIN "order" o ON o.id = i.order_id '
+        "WHERE o.status = 'Delivered' GROUP BY date(o.date_placed), COALESCE(i.category_id, 0)"
+    )
+
+
+def downgrade():
+    op.drop_table('daily_category_sales')
+    op.drop_table('daily_sales')
+    with op.batch_alter_table('order_item') as batch_op:
+        batch_op.drop_column('category_id')
+        batch_op.drop_column('product_id')
@@ -0,0 +1,34 @@
+"""add composite indexes for product listing sorts
+
+Revision ID: c8e0a2b4d6f7
+Revises: a7c9e1b3d5f6
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e0a2b4d6f7'
+down_revision = 'a7c9e1b3d5f6'
+branch_labels = None
+depends_on = None
+
+# (اسم الفهرس، الأعمدة) — مطابقة لـ Product.__table_args__
+INDEXES = [
+    ('ix_product_price_id', ['price', 'id']),
+    ('ix_product_name_id', ['name', 'id']),
+]
+
+
+def upgrade():
+    existing = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('product')}
+    for name, columns in INDEXES:
+        if name not in existing:
+            op.create_index(name, 'product', columns)
+
+
+def downgrade():
+    for name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name='product')
@@ -0,0 +1,32 @@
+"""add product sku
+
+Revision ID: d2f4a6b8c0e1
+Revises: b6d8f1a2c3e4
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f4a6b8c0e1'
+down_revision = 'b6d8f1a2c3e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'sku' not in {c['name'] for c in inspector.get_columns('product')}:
+        with op.batch_alter_table('product') as batch_op:
+            batch_op.add_column(sa.Column('sku', sa.String(length=64), nullable=True))
+    # فهرس فريد وليس قيداً على العمود: يكفي لـ ON CONFLICT ويسمح بعدة قيم NULL
+    if 'ux_product_sku' not in {ix['name'] for ix in inspector.get_indexes('product')}:
+        op.create_index('ux_product_sku', 'product', ['sku'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ux_product_sku', table_name='product')
+    with op.batch_alter_table('product') as batch_op:
+        batch_op.drop_column('sku')
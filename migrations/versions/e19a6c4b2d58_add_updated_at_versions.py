@@ -0,0 +1,37 @@
+"""add updated_at versions to product, category and review
+
+Revision ID: e19a6c4b2d58
+Revises: 5d8f0b3c9e47
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e19a6c4b2d58'
+down_revision = '5d8f0b3c9e47'
+branch_labels = None
+depends_on = None
+
+TABLES = ('product', 'category', 'review')
+
+
+def _columns(table):
+    return {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    for table in TABLES:
+        if 'updated_at' not in _columns(table):
+            with op.batch_alter_table(table) as batch_op:
+                batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # SQLite لا يقبل قيمة افتراضية غير ثابتة عند ADD COLUMN، لذا نعبئ الصفوف الحالية هنا
+        op.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,37 @@
+"""add indexes for category listing sorts and admin section sorts
+
+Revision ID: e4b6d8f0a2c3
+Revises: c8e0a2b4d6f7
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b6d8f0a2c3'
+down_revision = 'c8e0a2b4d6f7'
+branch_labels = None
+depends_on = None
+
+# (اسم الفهرس، الجدول، الأعمدة) — مطابقة لـ __table_args__ في النماذج
+INDEXES = [
+    ('ix_product_category_id_price_id', 'product', ['category_id', 'price', 'id']),
+    ('ix_product_category_id_name_id', 'product', ['category_id', 'name', 'id']),
+    ('ix_order_total_price_id', 'order', ['total_price', 'id']),
+    ('ix_review_rating_id', 'review', ['rating', 'id']),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns in INDEXES:
+        # قد تكون موجودة إذا أُنشئت القاعدة عبر db.create_all()
+        if name not in {ix['name'] for ix in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,26 @@
+"""drop single-column product category index covered by the composite sort indexes
+
+Revision ID: f6c8e0a2b4d5
+Revises: e4b6d8f0a2c3
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c8e0a2b4d5'
+down_revision = 'e4b6d8f0a2c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # ix_product_category_id_price_id و ix_product_category_id_name_id تبدآن بـ category_id
+    if 'ix_product_category_id' in {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('product')}:
+        op.drop_index('ix_product_category_id', table_name='product')
+
+
+def downgrade():
+    op.create_index('ix_product_category_id', 'product', ['category_id'])
@@ -38,18 +38,52 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // --- 3. وظائف جلب وعرض البيانات ---
 
+    // حالة التحميل التدريجي لقائمة المنتجات (pagination بالمؤشر)
+    const PRODUCT_FIELDS = 'id,name,price,image_url,image_variants,category_name,stock,rating';
+    const productListState = {
+        categoryId: '',
+        searchTerm: '',
+        nextCursor: null,
+        loading: false,
+        requestId: 0
+    };
+    const productsSentinel = document.createElement('div');
+    productsSentinel.id = 'products-sentinel';
+
     /**
      * جلب المنتجات من الخادم باستخدام مسار الـ API المصحح: /api/products
+     * يجلب الصفحة الأولى فقط؛ الصفحات التالية تُحمّل عند التمرير.
      * @param {string} categoryId - فلتر حسب ID الفئة.
      * @param {string} searchTerm - فلتر حسب مصطلح البحث.
      */
     async function fetchProducts(categoryId = '', searchTerm = '') {
         productsContainer.innerHTML = '<p style="width: 100%; text-align: center;">جاري تحميل المنتجات...</p>';
-        
+
+        productListState.categoryId = categoryId;
+        productListState.searchTerm = searchTerm;
+        productListState.nextCursor = null;
+        productListState.loading = false;
+        productListState.requestId += 1;
+
+        await loadProductsPage(false);
+    }
+
+    /**
+     * جلب صفحة واحدة من المنتجات وإضافتها للعرض.
+     * @param {boolean} append - إضافة للنتائج الحالية بدلاً من استبدالها.
+     */
+    async function loadProductsPage(append) {
+        if (productListState.loading) return;
+        productListState.loading = true;
+        const requestId = productListState.requestId;
+
         // 🛑 المسار المصحح الذي يحل مشكلة الـ 404
-        let url = `/api/products?query=${encodeURIComponent(searchTerm)}`;
-        if (categoryId) {
-            url += `&category_id=${categoryId}`;
+        let url = `/api/products?query=${encodeURIComponent(productListState.searchTerm)}&fields=${PRODUCT_FIELDS}`;
+        if (productListState.categoryId) {
+            url += `&category_id=${productListState.categoryId}`;
+        }
+        if (append && productListState.nextCursor) {
+            url += `&cursor=${encodeURIComponent(productListState.nextCursor)}`;
         }
         
         try {
@@ -60,27 +94,49 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(`HTTP error! Status: ${response.status}`);
             }
             
-            const products = await response.json();
-            renderProducts(products);
+            const page = await response.json();
+            // تجاهل الردود القديمة إذا تغيّر الفلتر أثناء التحميل
+            if (requestId !== productListState.requestId) return;
+
+            productListState.nextCursor = page.next_cursor;
+            renderProducts(page.items, append);
 
         } catch (error) {
             console.error('Error fetching products:', error);
-            productsContainer.innerHTML = '<h2 style="width: 100%; color: red;">عفواً، حدث خطأ أثناء تحميل المنتجات.</h2>';
+            if (!append) {
+                productsContainer.innerHTML = '<h2 style="width: 100%; color: red;">عفواً، حدث خطأ أثناء تحميل المنتجات.</h2>';
+            }
+        } finally {
+            if (requestId === productListState.requestId) {
+                productListState.loading = false;
+            }
         }
     }
 
 
+    // نسخ WebP المصغرة (إن وُجدت) ليختار المتصفح أصغر صورة تناسب عرض البطاقة
+    function imageSrcset(variants, sizes) {
+        const entries = Object.entries(variants || {}).sort((a, b) => a[0] - b[0]);
+        if (!entries.length) return '';
+        return ` srcset="${entries.map(([width, url]) => `${url} ${width}w`).join(', ')}" sizes="${sizes}"`;
+    }
+
     /**
      * عرض قائمة المنتجات في واجهة المستخدم.
+     * @param {Array} products - المنتجات المراد عرضها.
+     * @param {boolean} append - إضافة البطاقات بعد الموجودة بدلاً من مسحها.
      */
-    function renderProducts(products) {
-        productsContainer.innerHTML = '';
-        if (products.length === 0) {
-            productsContainer.innerHTML = '<p style="width: 100%;">لا توجد منتجات تطابق المعايير المختارة.</p>';
-            return;
+    function renderProducts(products, append = false) {
+        if (!append) {
+            productsContainer.innerHTML = '';
+            if (products.length === 0) {
+                productsContainer.innerHTML = '<p style="width: 100%;">لا توجد منتجات تطابق المعايير المختارة.</p>';
+                return;
+            }
         }
         
         const favoritesIds = JSON.parse(sessionStorage.getItem('current_favorites') || '[]');
+        const fragment = document.createDocumentFragment();
 
         products.forEach(product => {
             const productCard = document.createElement('div');
@@ -93,7 +149,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             productCard.innerHTML = `
                 <a href="/product/${product.id}"> 
-                    <img src="${product.image_url}" alt="${product.name}" onerror="this.src='/static/placeholder.png'">
+                    <img src="${product.image_url}" alt="${product.name}"${imageSrcset(product.image_variants, '300px')} loading="lazy" onerror="this.removeAttribute('srcset'); this.src='/static/placeholder.png'">
                 </a>
                 <h3><a href="/product/${product.id}">${product.name}</a></h3>
                 <p style="font-size: 0.9em; color: #6c757d;">الفئة: ${product.category_name}</p>
@@ -113,11 +169,31 @@ document.addEventListener('DOMContentLoaded', () => {
                     </button>
                 </div>
             `;
-            productsContainer.appendChild(productCard);
+            // يجب إضافة مستمعي الأحداث هنا بعد بناء البطاقات
+            setupProductEventListeners(productCard);
+            fragment.appendChild(productCard);
         });
 
-        // يجب إضافة مستمعي الأحداث هنا بعد بناء البطاقات
-        setupProductEventListeners();
+        productsContainer.appendChild(fragment);
+        // عنصر المراقبة يبقى دائماً في نهاية الشبكة لتحميل الصفحة التالية
+        productsContainer.appendChild(productsSentinel);
+    }
+
+    // تحميل الصفحة التالية عند اقتراب المستخدم من نهاية القائمة
+    if ('IntersectionObserver' in window) {
+        const productsObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting) && productListState.nextCursor) {
+                loadProductsPage(true);
+            }
+        }, { rootMargin: '400px' });
+        productsObserver.observe(productsSentinel);
+    } else {
+        window.addEventListener('scroll', () => {
+            const nearBottom = window.innerHeight + window.scrollY >= document.body.offsetHeight - 400;
+            if (nearBottom && productListState.nextCursor) {
+                loadProductsPage(true);
+            }
+        });
     }
 
     /**
@@ -248,16 +324,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
     /**
      * إعداد مستمعي الأحداث لأزرار السلة والمفضلة بعد عرض المنتجات.
+     * @param {Element} root - البطاقة الجديدة فقط حتى لا تتكرر المستمعات عند التحميل التدريجي.
      */
-    function setupProductEventListeners() {
-        document.querySelectorAll('.add-to-cart-btn').forEach(button => {
+    function setupProductEventListeners(root = document) {
+        root.querySelectorAll('.add-to-cart-btn').forEach(button => {
             button.addEventListener('click', (e) => {
                 const productId = e.target.getAttribute('data-id');
                 addToCart(productId);
             });
         });
 
-        document.querySelectorAll('.toggle-favorite-btn').forEach(button => {
+        root.querySelectorAll('.toggle-favorite-btn').forEach(button => {
             button.addEventListener('click', (e) => {
                 const productId = e.target.getAttribute('data-id');
                 toggleFavorite(productId, e.target);